@@ -0,0 +1,367 @@
+"""
+Measure build performance on generated sites.
+
+Run ``python -m attics.benchmark --help`` for the options. Results are
+written as JSON so they can be compared between commits.
+
+"""
+from __future__ import absolute_import
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from attics import __version__
+from attics.tools import run, make_configuration
+from attics.timing import Timings
+
+
+WORDS = (
+    u'lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+    u'eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad '
+    u'minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+    u'ex ea commodo consequat duis aute irure in reprehenderit voluptate '
+    u'velit esse cillum fugiat nulla pariatur excepteur sint occaecat '
+    u'cupidatat non proident sunt culpa qui officia deserunt mollit anim '
+    u'id est laborum'
+).split()
+
+HEAVY_MODULES = [
+    'markdown', 'jinja2', 'PIL', 'brotli', 'multiprocessing', 'subprocess',
+    'ctypes', 'cProfile', 'pprint',
+]
+"""Modules that importing :mod:`attics.tools` must not load"""
+
+_IMPORT_SCRIPT = '''
+import sys, json, time
+before = set(sys.modules)
+started = time.time()
+__import__(%r)
+seconds = time.time() - started
+modules = set(name for name, module in sys.modules.items() if module)
+sys.stdout.write(json.dumps({
+    'seconds': seconds,
+    'modules': sorted(modules - before),
+}))
+'''
+
+
+def generate_site(directory, pages=100, page_size=2000, metadata=2,
+                  assets=5, seed=0):
+    """
+    Generate a site in ``directory`` and return the path to its
+    configuration file.
+
+    :param pages:       the number of Markdown pages
+    :param page_size:   the approximate size of each page in characters
+    :param metadata:    the number of extra metadata fields per page,
+                        besides the title and index
+    :param assets:      the number of files listed in the ``[files]``
+                        section of the configuration file
+    :param seed:        the random seed, so the same parameters always
+                        generate the same site
+
+    """
+    rand = random.Random(seed)
+    content_dir = os.path.join(directory, 'content')
+    os.makedirs(os.path.join(content_dir, 'assets'))
+    for i in range(pages):
+        lines = [
+            u'Title: %s %d' % (rand.choice(WORDS).title(), i),
+            u'Index: %d' % rand.randint(0, 10),
+        ]
+        for j in range(metadata):
+            lines.append(u'Field%d: %s' % (j, _sentence(rand, 5)))
+        lines.append(u'')
+        lines.extend(_body(rand, page_size))
+        _write(os.path.join(content_dir, 'page%05d.md' % i), lines)
+    config = [u'[site]', u'title: Benchmark Site', u'[files]']
+    for i in range(assets):
+        name = 'asset%d' % i
+        _write(
+            os.path.join(content_dir, 'assets', name + '.css'),
+            [u'.%s { margin: %dpx; }' % (name, j) for j in range(100)],
+        )
+        config.append(u'%s: assets/%s.css' % (name, name))
+    config_filename = os.path.join(directory, 'site.ini')
+    _write(config_filename, config)
+    return config_filename
+
+
+def _sentence(rand, words):
+    return u' '.join(rand.choice(WORDS) for i in range(words))
+
+
+def _body(rand, size):
+    lines, length = [], 0
+    while length < size:
+        kind = rand.random()
+        if kind < 0.1:
+            block = u'## %s\n' % _sentence(rand, 4).title()
+        elif kind < 0.25:
+            block = u'\n'.join(
+                u'*   %s' % _sentence(rand, 6) for i in range(4)
+            ) + u'\n'
+        else:
+            block = _sentence(rand, 60) + u'\n'
+        lines.append(block)
+        length += len(block)
+    return lines
+
+
+def _write(path, lines):
+    with io.open(path, 'w', encoding='utf-8') as fp:
+        fp.write(u'\n'.join(lines) + u'\n')
+
+
+def peak_memory_kb():
+    """
+    Return the peak resident set size of this process and its waited
+    for children in kilobytes, or ``None`` where it can't be measured.
+
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def measure_build(config):
+    """
+    Build the site described by ``config`` and return a dict of the
+    wall time, phase times, file counts and peak memory.
+
+    """
+    timings = Timings()
+    started = time.time()
+    stats = run(config, timings)
+    return {
+        'wall': time.time() - started,
+        'phases': timings.phases,
+        'files': stats,
+        'peak_memory_kb': peak_memory_kb(),
+    }
+
+
+def measure_import(module='attics.tools'):
+    """
+    Import ``module`` in a new interpreter and return a dict of the
+    ``'seconds'`` it took and the sorted names of the ``'modules'`` it
+    loaded.
+
+    Where Python supports ``-X importtime`` (3.7 and later), the time
+    is the cumulative import time it reports for ``module``.
+
+    """
+    command = [sys.executable]
+    importtime = sys.version_info >= (3, 7)
+    if importtime:
+        command.extend(['-X', 'importtime'])
+    command.extend(['-c', _IMPORT_SCRIPT % module])
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError('Importing %s failed: %s' % (module, err))
+    result = json.loads(out.decode('utf-8'))
+    if importtime:
+        # Lines look like "import time: self [us] | cumulative | name"
+        for line in err.decode('utf-8').splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                result['seconds'] = int(fields[1]) / 1e6
+    return result
+
+
+def _measure_in_child(config, queue):
+    try:
+        queue.put(measure_build(config))
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def measure_build_in_child(config):
+    """
+    Like :func:`measure_build`, but build in a new process so that the
+    peak memory is that of the build alone.
+
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_measure_in_child, args=(config, queue),
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError('Benchmark build failed: %s' % result['error'])
+    return result
+
+
+def run_benchmark(pages=100, page_size=2000, metadata=2, assets=5,
+                  repeat=3, jobs=1, cache=True, streaming=False):
+    """
+    Generate a site and build it ``repeat`` times, each time from
+    scratch and then again without changes, after measuring how long
+    importing :mod:`attics.tools` takes. Return a dict of the
+    parameters and results, ready to be serialized as JSON.
+
+    """
+    parameters = {
+        'pages': pages,
+        'page_size': page_size,
+        'metadata': metadata,
+        'assets': assets,
+        'repeat': repeat,
+        'jobs': jobs,
+        'cache': cache,
+        'streaming': streaming,
+    }
+    workdir = tempfile.mkdtemp(prefix='attics_benchmark')
+    try:
+        config_filename = generate_site(
+            workdir, pages, page_size, metadata, assets,
+        )
+        runs = []
+        for i in range(repeat):
+            output_dir = os.path.join(workdir, 'output')
+            cache_dir = os.path.join(workdir, 'cache')
+            for path in (output_dir, cache_dir):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+            os.mkdir(output_dir)
+            config = make_configuration(
+                config_filename,
+                input_path=os.path.join(workdir, 'content'),
+                output_path=output_dir,
+                jobs=jobs,
+                cache=cache,
+            )
+            config['attics']['cache_path'] = cache_dir
+            config['attics']['streaming'] = 'yes' if streaming else 'no'
+            runs.append({
+                'cold': measure_build_in_child(config),
+                'warm': measure_build_in_child(config),
+            })
+    finally:
+        shutil.rmtree(workdir)
+    return {
+        'attics_version': __version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'import': measure_import(),
+        'runs': runs,
+    }
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark Attics builds of a generated site.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--pages',
+        dest='pages',
+        type=int,
+        default=100,
+        metavar='N',
+        help='Number of pages to generate.',
+    )
+    parser.add_argument(
+        '--page-size',
+        dest='page_size',
+        type=int,
+        default=2000,
+        metavar='CHARS',
+        help='Approximate characters per page.',
+    )
+    parser.add_argument(
+        '--metadata',
+        dest='metadata',
+        type=int,
+        default=2,
+        metavar='N',
+        help='Extra metadata fields per page.',
+    )
+    parser.add_argument(
+        '--assets',
+        dest='assets',
+        type=int,
+        default=5,
+        metavar='N',
+        help='Number of files to copy.',
+    )
+    parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        type=int,
+        default=3,
+        metavar='N',
+        help='Number of cold and warm build pairs.',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Number of reader processes.',
+    )
+    parser.add_argument(
+        '--no-cache',
+        dest='cache',
+        action='store_false',
+        help='Disable the conversion cache.',
+    )
+    parser.add_argument(
+        '--streaming',
+        dest='streaming',
+        action='store_true',
+        help='Use the streaming build mode.',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        dest='output',
+        metavar='FILE',
+        help='Write the JSON results to FILE instead of standard output.',
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    results = run_benchmark(
+        args.pages, args.page_size, args.metadata, args.assets,
+        args.repeat, args.jobs, args.cache, args.streaming,
+    )
+    serialized = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(serialized + '\n')
+    else:
+        sys.stdout.write(serialized + '\n')
+
+
+if __name__ == '__main__':
+    main()
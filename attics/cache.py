@@ -0,0 +1,122 @@
+import os
+import io
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionCache(object):
+    """
+    A persistent cache of converted Markdown, stored as one JSON file
+    per entry under :attr:`location`.
+
+    Entries are keyed by a hash of the raw source and the converter
+    configuration, so any change to either is a cache miss. Reading
+    an entry refreshes its mtime, and :meth:`prune` removes the least
+    recently used entries once the cache grows past :attr:`max_size`.
+
+    """
+
+    location = None
+    """The directory the cache entries are stored in"""
+
+    max_size = None
+    """The maximum total size of the cache entries in bytes"""
+
+    def __init__(self, location, max_size):
+        self.location, self.max_size = location, max_size
+
+    def key(self, raw, fingerprint):
+        """
+        Return the cache key for the unicode source ``raw`` converted
+        with the configuration described by the string ``fingerprint``.
+
+        """
+        digest = hashlib.sha1(fingerprint.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(raw.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Return the ``(content, metadata)`` tuple stored under ``key``,
+        or ``None`` if there isn't one.
+
+        """
+        path = self._entry_path(key)
+        try:
+            with io.open(path, encoding='utf-8') as fp:
+                entry = json.load(fp)
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            logger.warning("Ignoring corrupt cache entry %s", path)
+            return None
+        logger.debug("Cache hit for %s", key)
+        return entry['content'], entry['metadata']
+
+    def put(self, key, content, metadata):
+        """
+        Store ``content`` and ``metadata`` under ``key``.
+
+        The entry is written to a temporary file and renamed into
+        place, so concurrent readers never see a partial entry.
+
+        """
+        path = self._entry_path(key)
+        entry_dir = os.path.dirname(path)
+        try:
+            os.makedirs(entry_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        serialized = json.dumps({'content': content, 'metadata': metadata})
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(serialized.encode('utf-8'))
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def prune(self):
+        """
+        Remove the least recently used entries until the total size
+        of the cache is no more than :attr:`max_size`.
+
+        """
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.location):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        logger.info(
+            "Removed %d old entries from the cache at '%s'",
+            removed,
+            self.location,
+        )
+
+    def _entry_path(self, key):
+        return os.path.join(self.location, key[:2], key + '.json')
@@ -0,0 +1,185 @@
+import os
+import io
+import gzip
+import logging
+import multiprocessing.pool
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from attics.utils import write_bytes, file_digest, worker_count
+
+
+logger = logging.getLogger(__name__)
+
+
+COMPRESSIBLE_EXTENSIONS = [
+    '.html', '.css', '.js', '.json', '.svg', '.xml', '.txt',
+]
+"""Extensions of the output files that get compressed sidecars"""
+
+
+def gzip_bytes(data, level):
+    """
+    Return ``data`` gzip compressed at ``level``, with no file name or
+    timestamp in the header so the output only depends on the input.
+
+    """
+    out = io.BytesIO()
+    fp = gzip.GzipFile('', 'wb', level, out, mtime=0)
+    try:
+        fp.write(data)
+    finally:
+        fp.close()
+    return out.getvalue()
+
+
+def brotli_bytes(data, level):
+    """Return ``data`` brotli compressed at ``level``."""
+    return brotli.compress(data, quality=level)
+
+
+class Compressor(object):
+    """
+    Writes precompressed ``.gz`` and, if the ``brotli`` package is
+    installed, ``.br`` files next to output files, for web servers
+    that serve them directly (like nginx's ``gzip_static``).
+
+    """
+
+    min_size = None
+    """Files smaller than this many bytes are not compressed"""
+
+    def __init__(self, min_size=1024, gzip_level=9, brotli_level=11):
+        self.min_size = min_size
+        self.formats = [('.gz', gzip_bytes, gzip_level)]
+        if brotli is not None:
+            self.formats.append(('.br', brotli_bytes, brotli_level))
+
+    def compress(self, path, previous=None):
+        """
+        Write the compressed sidecar files for ``path`` and return a
+        tuple of its manifest entry and the number of sidecars written.
+
+        The entry is a ``[hash, size, mtime, levels]`` list, where
+        ``levels`` is a dict of the compression level of each sidecar
+        keyed by its extension. Given the file's ``previous`` entry,
+        the file is only hashed again if its size or mtime changed, and
+        only the sidecars whose content or level changed are written.
+        The entry is ``None`` if the file is too small to compress, in
+        which case its old sidecars are deleted.
+
+        """
+        size, mtime = _stat(path)
+        if size < self.min_size:
+            self.remove_sidecars(path)
+            return None, 0
+        if previous is not None and previous[1:3] == [size, mtime]:
+            digest = previous[0]
+        else:
+            digest = file_digest(path)
+        data = None
+        written = 0
+        levels = {}
+        for extension, compress, level in self.formats:
+            levels[extension] = level
+            if _sidecar_current(path, extension, level, digest, previous):
+                continue
+            if data is None:
+                with io.open(path, 'rb') as fp:
+                    data = fp.read()
+            write_bytes(path + extension, compress(data, level))
+            written += 1
+        if previous is not None:
+            for extension in set(previous[3]) - set(levels):
+                self.remove_sidecars(path, [extension])
+        return [digest, size, mtime, levels], written
+
+    def is_current(self, path, previous):
+        """
+        Return True if the sidecars of ``path`` are all up to date
+        according to its ``previous`` manifest entry, without reading
+        the file.
+
+        """
+        if previous is None or previous[1:3] != list(_stat(path)):
+            return False
+        if previous[1] < self.min_size or len(previous[3]) != len(
+                self.formats):
+            return False
+        return all(
+            _sidecar_current(path, extension, level, previous[0], previous)
+            for extension, _, level in self.formats
+        )
+
+    def remove_sidecars(self, path, extensions=('.gz', '.br')):
+        """Delete the compressed sidecar files of ``path``, if any."""
+        for extension in extensions:
+            sidecar = path + extension
+            if os.path.lexists(sidecar):
+                logger.info("Deleting stale %s", sidecar)
+                os.remove(sidecar)
+
+    def compress_all(self, paths, previous_entries, jobs=1):
+        """
+        Compress each of the files in ``paths`` whose extension is in
+        :data:`COMPRESSIBLE_EXTENSIONS` using ``jobs`` threads, and
+        return a tuple of a dict of their manifest entries keyed by
+        path, as returned by :meth:`compress`, and the number of
+        sidecars written.
+
+        ``previous_entries`` is a dict like the one returned by the
+        previous build, used to skip up to date sidecars without
+        reading their files. The sidecars of the files in it that
+        aren't compressed anymore are deleted.
+
+        """
+        entries, stale = {}, []
+        for path in paths:
+            if os.path.splitext(path)[1].lower() not in (
+                    COMPRESSIBLE_EXTENSIONS):
+                continue
+            previous = previous_entries.get(path)
+            if self.is_current(path, previous):
+                entries[path] = previous
+            else:
+                stale.append((path, previous))
+        jobs = worker_count(jobs, len(stale))
+        if jobs <= 1:
+            results = [self.compress(*task) for task in stale]
+        else:
+            # zlib and brotli release the GIL while compressing
+            pool = multiprocessing.pool.ThreadPool(jobs)
+            try:
+                results = pool.map(lambda task: self.compress(*task), stale)
+            finally:
+                pool.close()
+                pool.join()
+        written = 0
+        for (path, _), (entry, count) in zip(stale, results):
+            if entry is not None:
+                entries[path] = entry
+            written += count
+        for path in previous_entries:
+            if path not in entries:
+                self.remove_sidecars(path)
+        return entries, written
+
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def _sidecar_current(path, extension, level, digest, previous):
+    # Up to date if made at the same level from the same content, and
+    # not older than the file, in case it was replaced by another one
+    if previous is None or previous[0] != digest:
+        return False
+    if previous[3].get(extension) != level:
+        return False
+    sidecar = path + extension
+    return (os.path.isfile(sidecar)
+            and os.path.getmtime(sidecar) >= previous[2])
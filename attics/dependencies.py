@@ -0,0 +1,199 @@
+import json
+import hashlib
+import logging
+from collections import Mapping
+
+import jinja2
+
+
+logger = logging.getLogger(__name__)
+
+
+KINDS = ('templates', 'site', 'files', 'images')
+"""The kinds of inputs recorded for each output"""
+
+ALL_KEYS = '*'
+"""
+Recorded instead of a key when a template iterates over a dict or
+measures it, so that adding or removing any key counts as a change.
+"""
+
+
+class Dependencies(object):
+    """
+    The templates, ``site`` options and theme files and images a page
+    was rendered from, as recorded by a :class:`RecordingEnvironment`
+    and the :class:`RecordingDict` instances in its context.
+
+    """
+
+    templates = None
+    """The set of the names of the templates rendered, included and so on"""
+
+    site = None
+    """The set of the keys of the ``site`` options used"""
+
+    files = None
+    """The set of the names of the ``files`` entries used"""
+
+    images = None
+    """The set of the names of the ``images`` entries used"""
+
+    fragments = None
+    """
+    The set of the names of the fragments used, whose own dependencies
+    are added with :meth:`update` once the page is rendered.
+    """
+
+    def __init__(self, data=None):
+        self.fragments = set()
+        for kind in KINDS:
+            setattr(self, kind, set((data or {}).get(kind, ())))
+
+    @classmethod
+    def merge_all(cls, recorded):
+        """
+        Return the :class:`Dependencies` with every input named in the
+        dicts of :meth:`to_json` lists in ``recorded``.
+
+        """
+        merged = cls()
+        for data in recorded:
+            for kind in KINDS:
+                getattr(merged, kind).update(data.get(kind, ()))
+        return merged
+
+    def update(self, other):
+        """Add the dependencies of the :class:`Dependencies` ``other``."""
+        for kind in KINDS:
+            getattr(self, kind).update(getattr(other, kind))
+
+    def to_json(self):
+        """Return a dict of sorted lists of names keyed by kind."""
+        return dict((kind, sorted(getattr(self, kind))) for kind in KINDS)
+
+
+class RecordingDict(Mapping):
+    """
+    A read-only view of the dict ``data`` that adds the keys looked up
+    in it to the set ``keys``, or :data:`ALL_KEYS` if it is iterated
+    over.
+
+    It isn't a ``dict`` subclass, since copying one or serializing it
+    to JSON would read every key without recording them.
+
+    """
+
+    def __init__(self, data, keys):
+        self._data, self._keys = data, keys
+
+    def __getitem__(self, key):
+        self._keys.add(key)
+        return self._data[key]
+
+    def __contains__(self, key):
+        self._keys.add(key)
+        return key in self._data
+
+    def __iter__(self):
+        self._keys.add(ALL_KEYS)
+        return iter(self._data)
+
+    def __len__(self):
+        self._keys.add(ALL_KEYS)
+        return len(self._data)
+
+
+class RecordingEnvironment(jinja2.Environment):
+    """
+    A ``jinja2.Environment`` that adds the name of every template it
+    loads, including those used by ``{% include %}``, ``{% extends %}``
+    and ``{% import %}`` while rendering, to :attr:`dependencies`.
+
+    """
+
+    dependencies = None
+    """The :class:`Dependencies` being recorded, or ``None``"""
+
+    def get_template(self, name, parent=None, globals=None):
+        if self.dependencies is not None and isinstance(name, basestring):
+            self.dependencies.templates.add(self.join_path(name, parent))
+        return super(RecordingEnvironment, self).get_template(
+            name, parent, globals,
+        )
+
+    def select_template(self, names, parent=None, globals=None):
+        # Every name is recorded, since creating a template earlier in
+        # the list changes which one is used
+        if self.dependencies is not None:
+            self.dependencies.templates.update(
+                self.join_path(name, parent) for name in names
+                if isinstance(name, basestring)
+            )
+        return super(RecordingEnvironment, self).select_template(
+            names, parent, globals,
+        )
+
+
+def input_state(theme, site, dependencies):
+    """
+    Return the current state of the inputs named in the dict of
+    ``dependencies`` lists keyed by kind: a dict of hashes of the
+    templates of ``theme`` and the values of the ``site`` options, and
+    of the output names of the theme's files and images, keyed by name
+    and then by kind. Missing inputs have ``None`` as state.
+
+    """
+    sources = {
+        'site': site,
+        'files': theme.files,
+        'images': theme.images,
+    }
+    state = dict((kind, {}) for kind in KINDS)
+    for kind in KINDS:
+        for name in dependencies.get(kind, ()):
+            if kind == 'templates':
+                state[kind][name] = _template_digest(theme.environment, name)
+            else:
+                state[kind][name] = _value_state(kind, sources[kind], name)
+    return state
+
+
+def changed_inputs(previous_state, theme, site):
+    """
+    Return the set of ``(kind, name)`` tuples of the inputs whose
+    state in the dict ``previous_state`` returned by
+    :func:`input_state` is no longer current.
+
+    """
+    current = input_state(theme, site, previous_state)
+    changed = set()
+    for kind in KINDS:
+        for name, value in previous_state.get(kind, {}).items():
+            if current[kind][name] != value:
+                logger.debug("Input %s '%s' changed", kind, name)
+                changed.add((kind, name))
+    return changed
+
+
+def _template_digest(environment, name):
+    try:
+        source = environment.loader.get_source(environment, name)[0]
+    except jinja2.TemplateNotFound:
+        return None
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def _value_state(kind, values, name):
+    if name == ALL_KEYS:
+        value = dict(
+            (key, _value_state(kind, values, key)) for key in values
+        )
+    elif name not in values:
+        return None
+    elif kind == 'site':
+        value = values[name]
+    else:
+        return unicode(values[name])
+    serialized = json.dumps(value, sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
@@ -0,0 +1,239 @@
+import os
+import io
+import re
+import json
+import hashlib
+import logging
+import posixpath
+import multiprocessing
+
+try:
+    from PIL import Image as PILImage, __version__ as PIL_VERSION
+except ImportError:
+    PILImage = PIL_VERSION = None
+
+from attics.utils import write_bytes, worker_count
+
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+"""Extensions of the images that get resized variants"""
+
+VARIANT_DEFAULTS = {
+    'widths': None,
+    'quality': '85',
+    'sizes': '100vw',
+}
+"""The defaults of the options in the ``[variants]`` section"""
+
+_formats = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+_img_re = re.compile(r'<img\b[^>]*?(\s*/?)>', re.IGNORECASE)
+_src_re = re.compile(r'''\ssrc=(["'])(.*?)\1''', re.IGNORECASE)
+_srcset_re = re.compile(r'\ssrcset=', re.IGNORECASE)
+
+
+def parse_widths(value):
+    """
+    Return the sorted list of the widths in the string ``value``,
+    separated by commas or spaces.
+
+    Raises ValueError if one of them isn't a positive integer.
+
+    """
+    widths = [int(width) for width in value.replace(',', ' ').split()]
+    if any(width <= 0 for width in widths):
+        raise ValueError('Widths must be positive')
+    return sorted(set(widths))
+
+
+def variant_path(path, width):
+    """Return the path of the variant of the image ``path`` ``width`` wide."""
+    base, extn = os.path.splitext(path)
+    return '%s-%dw%s' % (base, width, extn)
+
+
+class ImageVariants(object):
+    """
+    Makes resized and recompressed copies of images, and adds them to
+    the ``<img>`` tags of pages as ``srcset`` attributes so browsers
+    can download the smallest one that looks sharp.
+
+    The copies are kept in :attr:`cache_dir`, keyed by a hash of the
+    source image and the resizing parameters, so each one is only
+    made once.
+
+    """
+
+    widths = None
+    """The sorted list of widths to make variants at, in pixels"""
+
+    quality = None
+    """The JPEG and WebP quality, from 1 to 95"""
+
+    sizes = None
+    """The ``sizes`` attribute added next to each ``srcset``"""
+
+    cache_dir = None
+    """The folder the variants and image sizes are kept in"""
+
+    srcsets = None
+    """
+    A dict of ``(width, path)`` lists of the variants of each image,
+    and the image itself, keyed by the image's path relative to the
+    output folder, with forward slashes.
+    """
+
+    def __init__(self, widths, cache_dir, quality=85, sizes='100vw'):
+        self.widths, self.cache_dir = widths, cache_dir
+        self.quality, self.sizes = quality, sizes
+        self.srcsets = {}
+
+    def make(self, images, jobs=1):
+        """
+        Make the variants of ``images``, a list of ``(relpath, path,
+        digest)`` tuples of the images' output paths, source paths and
+        content hashes, and update :attr:`srcsets`.
+
+        Return a list of ``(cached, relpath)`` tuples of the variants'
+        files in the cache and their output paths.
+
+        Images whose variants aren't all cached yet are resized by
+        ``jobs`` processes.
+
+        """
+        tasks = [
+            (path, digest, self.widths, self.quality, self.cache_dir)
+            for relpath, path, digest in images
+        ]
+        results = [_cached_variants(task) for task in tasks]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            logger.info("Resizing %d images", len(missing))
+            jobs = worker_count(jobs, len(missing))
+            todo = [tasks[i] for i in missing]
+            if jobs <= 1:
+                made = [_make_variants(task) for task in todo]
+            else:
+                pool = multiprocessing.Pool(jobs)
+                try:
+                    made = pool.map(_make_variants, todo)
+                finally:
+                    pool.close()
+                    pool.join()
+            for i, result in zip(missing, made):
+                results[i] = result
+        files = []
+        for image, (width, variants) in zip(images, results):
+            relpath = image[0]
+            srcset = []
+            for variant_width, cached in variants:
+                variant = variant_path(relpath, variant_width)
+                files.append((cached, variant))
+                srcset.append((variant_width, variant))
+            srcset.append((width, relpath))
+            self.srcsets[relpath] = srcset
+        return files
+
+    def rewrite(self, html, directory=u''):
+        """
+        Return the HTML content ``html`` of a page in the output folder
+        ``directory`` with ``srcset`` and ``sizes`` attributes added to
+        the ``<img>`` tags showing images in :attr:`srcsets`.
+
+        Tags that already have a ``srcset`` are left alone.
+
+        """
+        def replace(match):
+            tag = match.group(0)
+            src = _src_re.search(tag)
+            if src is None or _srcset_re.search(tag):
+                return tag
+            url = src.group(2)
+            relpath = posixpath.normpath(posixpath.join(directory, url))
+            srcset = self.srcsets.get(relpath)
+            if srcset is None or len(srcset) < 2:
+                return tag
+            prefix = posixpath.dirname(url)
+            candidates = ', '.join(
+                '%s %dw' % (
+                    posixpath.join(prefix, posixpath.basename(path)), width,
+                )
+                for width, path in srcset
+            )
+            end = match.start(1) - match.start(0)
+            return u'%s srcset="%s" sizes="%s"%s' % (
+                tag[:end], candidates, self.sizes, tag[end:],
+            )
+        return _img_re.sub(replace, html)
+
+
+def _cache_path(cache_dir, key, extn):
+    return os.path.join(cache_dir, key[:2], key + extn)
+
+
+def _variant_key(digest, width, quality):
+    params = json.dumps([digest, width, quality, PIL_VERSION])
+    return hashlib.sha1(params.encode('utf-8')).hexdigest()
+
+
+def _cached_variants(task):
+    """
+    Return the result :func:`_make_variants` would return for
+    ``task`` if everything is cached, or ``None``.
+
+    """
+    path, digest, widths, quality, cache_dir = task
+    try:
+        with io.open(_cache_path(cache_dir, digest, '.json')) as fp:
+            width = json.load(fp)['width']
+    except (IOError, ValueError, KeyError):
+        return None
+    extn = os.path.splitext(path)[1].lower()
+    variants = []
+    for variant_width in widths:
+        if variant_width >= width:
+            break
+        key = _variant_key(digest, variant_width, quality)
+        cached = _cache_path(cache_dir, key, extn)
+        if not os.path.isfile(cached):
+            return None
+        variants.append((variant_width, cached))
+    return width, variants
+
+
+def _make_variants(task):
+    """
+    Resize the image at ``path`` to each of ``widths`` narrower than
+    it, store the results in ``cache_dir``, and return a tuple of its
+    width and a list of ``(width, cached path)`` tuples.
+
+    """
+    path, digest, widths, quality, cache_dir = task
+    extn = os.path.splitext(path)[1].lower()
+    image = PILImage.open(path)
+    width, height = image.size
+    format = _formats[extn]
+    if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    resample = getattr(PILImage, 'LANCZOS', None) or PILImage.ANTIALIAS
+    variants = []
+    for variant_width in widths:
+        if variant_width >= width:
+            break
+        key = _variant_key(digest, variant_width, quality)
+        cached = _cache_path(cache_dir, key, extn)
+        if not os.path.isfile(cached):
+            size = (variant_width, max(1, height * variant_width // width))
+            out = io.BytesIO()
+            options = {'optimize': True}
+            if format in ('JPEG', 'WEBP'):
+                options['quality'] = quality
+            image.resize(size, resample).save(out, format, **options)
+            write_bytes(cached, out.getvalue())
+        variants.append((variant_width, cached))
+    size = json.dumps({'width': width, 'height': height})
+    write_bytes(_cache_path(cache_dir, digest, '.json'), size.encode('utf-8'))
+    return width, variants
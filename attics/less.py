@@ -0,0 +1,178 @@
+import os
+import io
+import re
+import shlex
+import hashlib
+import logging
+import tempfile
+import subprocess
+import multiprocessing.pool
+from distutils.spawn import find_executable
+
+from attics.utils import write_bytes, worker_count
+
+
+logger = logging.getLogger(__name__)
+
+
+_import_re = re.compile(
+    r'''@import\s*(?:\([^)]*\)\s*)?(?:url\(\s*)?["']([^"']+)["']''',
+)
+
+
+def find_less_files(dirpath):
+    """Return the sorted paths of the '.less' files in ``dirpath``."""
+    try:
+        names = os.listdir(dirpath)
+    except OSError:
+        return []
+    paths = [os.path.join(dirpath, name) for name in names]
+    return sorted(
+        path for path in paths
+        if path.lower().endswith('.less') and os.path.isfile(path)
+    )
+
+
+def find_imports(path, source):
+    """
+    Return the paths of the LESS files imported by the byte string
+    ``source`` read from ``path``, resolved relative to its folder.
+
+    Imports of CSS files and URLs are left out, since LESS doesn't
+    inline them.
+
+    """
+    dirpath = os.path.dirname(path)
+    imports = []
+    for name in _import_re.findall(source.decode('utf-8', 'replace')):
+        if '://' in name or name.lower().endswith('.css'):
+            continue
+        if not os.path.splitext(name)[1]:
+            name += '.less'
+        imports.append(os.path.normpath(os.path.join(dirpath, name)))
+    return imports
+
+
+class LessCompiler(object):
+    """
+    Compiles LESS files to CSS with an external compiler, running
+    several at once and caching the output by a hash of each file and
+    the files it imports, so unchanged stylesheets are never compiled
+    twice.
+
+    """
+
+    command = None
+    """The compiler command line, to which the input and output are added"""
+
+    cache_dir = None
+    """The folder compiled CSS is cached in, or ``None`` for no cache"""
+
+    def __init__(self, command='lessc', cache_dir=None):
+        self.command = command
+        self.cache_dir = cache_dir
+
+    def key(self, path):
+        """
+        Return a hex digest of the compiler command, the LESS file at
+        ``path`` and every file it imports, directly or not.
+
+        """
+        digest = hashlib.sha1(self.command.encode('utf-8'))
+        pending, seen = [os.path.normpath(path)], set()
+        while pending:
+            current = pending.pop(0)
+            if current in seen:
+                continue
+            seen.add(current)
+            digest.update(b'\0' + current.encode('utf-8') + b'\0')
+            try:
+                with io.open(current, 'rb') as fp:
+                    source = fp.read()
+            except IOError:
+                # The compiler reports missing imports, hashing their
+                # absence means creating them is a change
+                digest.update(b'missing')
+                continue
+            digest.update(source)
+            pending.extend(find_imports(current, source))
+        return digest.hexdigest()
+
+    def compile(self, src, dest):
+        """
+        Compile the LESS file ``src`` to the CSS file ``dest`` unless
+        the cache already has the output, and return True if ``dest``
+        is up to date afterwards.
+
+        The compiler writes to a temporary file, and ``dest`` is only
+        replaced if the output changed, so that compiling an unchanged
+        file doesn't look like a change to :mod:`watch`.
+
+        """
+        cache_path = None
+        if self.cache_dir is not None:
+            key = self.key(src)
+            cache_path = os.path.join(self.cache_dir, key[:2], key + '.css')
+            try:
+                with io.open(cache_path, 'rb') as fp:
+                    css = fp.read()
+            except IOError:
+                pass
+            else:
+                logger.debug("Cache hit for %s", src)
+                write_bytes(dest, css, only_if_changed=True)
+                return True
+        fd, tmp_path = tempfile.mkstemp(suffix='.css')
+        os.close(fd)
+        try:
+            proc = subprocess.Popen(
+                shlex.split(self.command) + [src, tmp_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            out, err = proc.communicate()
+            if proc.returncode != 0:
+                logger.warning("Failed to compile %s, output:", src)
+                logger.warning(out)
+                logger.warning("Error output:")
+                logger.warning(err)
+                return False
+            with io.open(tmp_path, 'rb') as fp:
+                css = fp.read()
+        finally:
+            os.remove(tmp_path)
+        if write_bytes(dest, css, only_if_changed=True):
+            logger.info("Compiled %s to %s", src, dest)
+        if cache_path is not None:
+            write_bytes(cache_path, css)
+        return True
+
+    def compile_all(self, paths, jobs=1):
+        """
+        Compile each of the LESS files in ``paths`` to a '.css' file
+        next to it using up to ``jobs`` compiler processes at once, and
+        return the number of files that compiled.
+
+        Nothing is compiled if the compiler can't be found.
+
+        """
+        if not paths:
+            return 0
+        if find_executable(shlex.split(self.command)[0]) is None:
+            logger.warning(
+                "Could not find LESS compiler, is it installed and on PATH?"
+            )
+            return 0
+        tasks = [(path, os.path.splitext(path)[0] + '.css') for path in paths]
+        jobs = worker_count(jobs, len(tasks))
+        if jobs <= 1:
+            results = [self.compile(*task) for task in tasks]
+        else:
+            # The threads only wait for compiler processes
+            pool = multiprocessing.pool.ThreadPool(jobs)
+            try:
+                results = pool.map(lambda task: self.compile(*task), tasks)
+            finally:
+                pool.close()
+                pool.join()
+        return sum(1 for result in results if result)
@@ -0,0 +1,336 @@
+import os
+import json
+import hashlib
+import logging
+
+from attics.utils import open_file, write_file, file_digest
+
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_NAME = '.attics-manifest.json'
+MANIFEST_VERSION = 10
+
+IGNORED_OPTIONS = {
+    'attics': (
+        'jobs', 'cache', 'cache_path', 'cache_size', 'streaming',
+        'copy_strategy', 'static_path', 'static_delete', 'search_index',
+        'sitemap', 'base_url', 'compress', 'compress_min_size',
+        'gzip_level', 'brotli_level',
+    ),
+}
+"""
+Options that only affect how a build runs, not what it produces, keyed
+by section. Changing these does not invalidate the manifest.
+"""
+
+IGNORED_SECTIONS = ('site', 'files', 'images')
+"""
+Sections whose options are recorded as the dependencies of each page
+that uses them instead, so changing one only renders those pages.
+"""
+
+
+def config_digest(config):
+    """
+    Return a hex digest of the dict of dicts ``config``, leaving out
+    the options in :data:`IGNORED_OPTIONS` and the sections in
+    :data:`IGNORED_SECTIONS`.
+
+    """
+    relevant = {}
+    for section, options in config.items():
+        if section in IGNORED_SECTIONS:
+            continue
+        ignored = IGNORED_OPTIONS.get(section, ())
+        relevant[section] = dict(
+            (k, v) for k, v in options.items() if k not in ignored
+        )
+    serialized = json.dumps(relevant, sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def theme_digest(theme):
+    """
+    Return a hex digest identifying the location, the template names of
+    the fragments and the image variant settings of the validated
+    :class:`models.Theme` ``theme``.
+
+    The templates themselves are recorded as the dependencies of each
+    page rendered with them instead.
+
+    """
+    fragments = dict(
+        (name, template.name)
+        for name, template in theme.fragment_templates.items()
+    )
+    digest = hashlib.sha1(os.path.abspath(theme.location).encode('utf-8'))
+    for settings in (fragments, theme.variants):
+        digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BuildManifest(object):
+    """
+    A record of the inputs used to produce an output directory.
+
+    Saved in the output directory after each build, and compared
+    against by the next build to decide which outputs are stale.
+
+    """
+
+    sources = None
+    """
+    A dict of ``{'source': ..., 'mtime': ..., 'size': ..., 'inode': ...,
+    'hash': ...}`` dicts keyed by source file path.
+    """
+
+    assets = None
+    """
+    A dict of dicts like those in :attr:`sources` keyed by the output
+    path of each copied file, which also have an ``'output'`` list of
+    the mtime, size and inode of the copy and the copy strategy used.
+    """
+
+    theme = None
+    """The :func:`theme_digest` of the theme used"""
+
+    config = None
+    """The :func:`config_digest` of the configuration used"""
+
+    navigation = None
+    """A list of ``[path, title, index]`` lists in navigation order"""
+
+    asset_names = None
+    """
+    A dict of the output names of fingerprinted files and images,
+    keyed by their plain names.
+    """
+
+    compressed = None
+    """
+    A dict of the :meth:`compress.Compressor.compress` entries of the
+    output files that have compressed sidecar files, keyed by output
+    path. Each records the level of every sidecar, so changing a
+    compression option only rewrites the sidecars it affects.
+    """
+
+    static = None
+    """
+    A sorted list of the output paths of the files copied from the
+    static folder and the image variants made from them, which are
+    also in :attr:`assets`.
+    """
+
+    image_variants = None
+    """
+    A dict of the sorted widths of the variants of each image, keyed
+    by the image's output path relative to the output folder.
+    """
+
+    search = None
+    """A list of the output paths of the search index files"""
+
+    sitemaps = None
+    """A list of the output paths of the sitemap files"""
+
+    dependencies = None
+    """
+    A dict of the :meth:`dependencies.Dependencies.to_json` lists of
+    the inputs each page was rendered from, keyed by output path
+    relative to the output folder.
+    """
+
+    inputs = None
+    """
+    The :func:`dependencies.input_state` of every input in
+    :attr:`dependencies`, to find the pages affected by a change.
+    """
+
+    def __init__(self):
+        self.sources, self.assets, self.navigation = {}, {}, []
+        self.asset_names, self.compressed = {}, {}
+        self.static, self.image_variants, self.search = [], {}, []
+        self.sitemaps, self.dependencies, self.inputs = [], {}, {}
+
+    @classmethod
+    def load(cls, output_dir):
+        """
+        Return the manifest saved in ``output_dir``, or ``None`` if
+        there isn't a usable one.
+
+        """
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open_file(path) as fp:
+                data = json.load(fp)
+        except (IOError, ValueError) as e:
+            logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+            return None
+        if data.get('version') != MANIFEST_VERSION:
+            logger.info("Ignoring manifest %s from another version", path)
+            return None
+        manifest = cls()
+        manifest.sources = data['sources']
+        manifest.assets = data['assets']
+        manifest.theme = data['theme']
+        manifest.config = data['config']
+        manifest.navigation = data['navigation']
+        manifest.asset_names = data['asset_names']
+        manifest.compressed = data['compressed']
+        manifest.static = data['static']
+        manifest.image_variants = data['image_variants']
+        manifest.search = data['search']
+        manifest.sitemaps = data['sitemaps']
+        manifest.dependencies = data['dependencies']
+        manifest.inputs = data['inputs']
+        return manifest
+
+    def save(self, output_dir):
+        data = {
+            'version': MANIFEST_VERSION,
+            'sources': self.sources,
+            'assets': self.assets,
+            'theme': self.theme,
+            'config': self.config,
+            'navigation': self.navigation,
+            'asset_names': self.asset_names,
+            'compressed': self.compressed,
+            'static': self.static,
+            'image_variants': self.image_variants,
+            'search': self.search,
+            'sitemaps': self.sitemaps,
+            'dependencies': self.dependencies,
+            'inputs': self.inputs,
+        }
+        serialized = unicode(json.dumps(data))
+        write_file(os.path.join(output_dir, MANIFEST_NAME), serialized)
+
+    def full_rebuild_reason(self, previous):
+        """
+        Return a string explaining why every page must be rendered
+        again since the ``previous`` manifest, or ``None`` if only
+        changed pages need to be.
+
+        """
+        if previous is None:
+            return 'no previous build manifest'
+        if previous.theme != self.theme:
+            return 'theme changed'
+        if previous.config != self.config:
+            return 'configuration changed'
+        if previous.navigation != self.navigation:
+            return 'page set, titles or indexes changed'
+        if previous.image_variants != self.image_variants:
+            return 'image variants changed'
+        return None
+
+    def affected_pages(self, changed):
+        """
+        Return the set of the output paths of the pages that depend on
+        one of the ``changed`` inputs, a set of ``(kind, name)`` tuples
+        like :func:`dependencies.changed_inputs` returns.
+
+        """
+        affected = set()
+        for path, dependencies in self.dependencies.items():
+            for kind, names in dependencies.items():
+                if any((kind, name) in changed for name in names):
+                    affected.add(path)
+                    break
+        return affected
+
+    def source_digests(self):
+        """
+        Return a dict of ``(mtime, size, hash)`` tuples keyed by the
+        path of every source and copied file recorded.
+
+        """
+        digests = {}
+        for entries in (self.sources, self.assets):
+            for entry in entries.values():
+                digests[entry['source']] = (
+                    entry['mtime'], entry['size'], entry['hash'],
+                )
+        return digests
+
+    def record_source(self, path, previous):
+        """
+        Record the source file at ``path`` and return True if it
+        changed since the ``previous`` manifest.
+
+        """
+        old_entries = previous.sources if previous is not None else {}
+        return _record(self.sources, path, path, old_entries)
+
+    def record_asset(self, src, dest, previous):
+        """
+        Record the copy of ``src`` to ``dest`` and return True if the
+        source changed since the ``previous`` manifest.
+
+        """
+        old_entries = previous.assets if previous is not None else {}
+        return _record(self.assets, dest, src, old_entries)
+
+    def record_output(self, dest, strategy):
+        """
+        Record the stat of the copy ``dest`` made with the copy
+        strategy ``strategy``, after :meth:`record_asset`.
+
+        """
+        self.assets[dest]['output'] = _output_stat(dest, strategy)
+
+    def output_unchanged(self, dest, strategy, previous):
+        """
+        Return True if the copy ``dest`` still has the mtime, size and
+        inode recorded in the ``previous`` manifest, and was made with
+        the same copy strategy ``strategy``.
+
+        """
+        if previous is None or dest not in previous.assets:
+            return False
+        output = previous.assets[dest].get('output')
+        return output is not None and output == _output_stat(dest, strategy)
+
+
+def _output_stat(dest, strategy):
+    try:
+        # Not following symbolic links made by the symlink strategy
+        st = os.lstat(dest)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_ino, strategy]
+
+
+def _record(entries, key, path, old_entries):
+    """
+    Store the stat and hash of ``path`` in ``entries[key]`` and return
+    True if it differs from ``old_entries[key]``.
+
+    The file is only hashed if its size, mtime or inode changed.
+
+    """
+    st = os.stat(path)
+    entry = {
+        'source': path,
+        'mtime': st.st_mtime,
+        'size': st.st_size,
+        'inode': st.st_ino,
+    }
+    old = old_entries.get(key)
+    if (old is not None and old.get('source') == path
+            and old['mtime'] == entry['mtime']
+            and old['size'] == entry['size']
+            and old['inode'] == entry['inode']):
+        entries[key] = dict(old)
+        return False
+    entry['hash'] = file_digest(path)
+    entries[key] = entry
+    return (
+        old is None
+        or old.get('source') != path
+        or old['hash'] != entry['hash']
+    )
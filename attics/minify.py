@@ -0,0 +1,154 @@
+import re
+import logging
+import multiprocessing
+
+from attics.utils import write_file, worker_count
+
+
+logger = logging.getLogger(__name__)
+
+
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'div', 'dl',
+    'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2',
+    'h3', 'h4', 'h5', 'h6', 'head', 'header', 'hr', 'html', 'li', 'link',
+    'main', 'meta', 'nav', 'ol', 'p', 'section', 'table', 'tbody', 'td',
+    'tfoot', 'th', 'thead', 'title', 'tr', 'ul', '!doctype',
+])
+"""Tags around which whitespace is never displayed"""
+
+OPTIONAL_END_TAGS = [
+    'body', 'dd', 'dt', 'head', 'html', 'li', 'option', 'tbody', 'td',
+    'tfoot', 'th', 'thead', 'tr',
+]
+"""
+End tags that HTML allows leaving out wherever valid markup has them.
+``</p>`` isn't one, since it can only be left out before some tags.
+"""
+
+_raw_re = re.compile(
+    r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL,
+)
+_comment_re = re.compile(r'<!--(?!\[if\b).*?-->', re.DOTALL)
+# These start with a literal character and only call back for spaces
+# next to tags, which is several times faster than matching the block
+# tags case insensitively at every position
+_space_before_re = re.compile(r' (?=</?([a-zA-Z0-9!]+))')
+_space_after_re = re.compile(r'(<(/?)([a-zA-Z0-9!]+)[^<>]*>) ')
+# Only lowercase end tags are left out, for the same reason
+_optional_re = re.compile(r'</(?:%s)\s*>' % '|'.join(OPTIONAL_END_TAGS))
+
+
+def minify_html(html):
+    """
+    Return the unicode HTML document ``html`` without comments, optional
+    end tags and the whitespace that browsers don't display.
+
+    The content of ``<pre>``, ``<textarea>``, ``<script>`` and
+    ``<style>`` elements is left as is, and so are conditional comments.
+
+    """
+    parts = []
+    position = 0
+    for match in _raw_re.finditer(html):
+        parts.append(_minify_text(html[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(_minify_text(html[position:]))
+    return u''.join(parts).strip()
+
+
+def _minify_text(text):
+    text = _comment_re.sub(u'', text)
+    collapsed = u' '.join(text.split())
+    if not collapsed:
+        return u' ' if text else u''
+    if text[0].isspace():
+        collapsed = u' ' + collapsed
+    if text[-1].isspace():
+        collapsed += u' '
+    text = _space_before_re.sub(_space_before, collapsed)
+    text = _space_after_re.sub(_space_after, text)
+    return _optional_re.sub(u'', text)
+
+
+def _space_before(match):
+    return u'' if match.group(1).lower() in BLOCK_TAGS else u' '
+
+
+def _space_after(match):
+    if match.group(3).lower() in BLOCK_TAGS:
+        return match.group(1)
+    return match.group(0)
+
+
+class HTMLMinifier(object):
+    """
+    Minifies pages with :func:`minify_html` and writes them out,
+    either right away or in a pool of worker processes while the next
+    pages are rendered.
+
+    """
+
+    jobs = None
+    """
+    The number of worker processes to start if :attr:`pool` isn't
+    given, one per CPU if zero or less, or 1 to minify in this process.
+    """
+
+    pool = None
+    """
+    The ``multiprocessing.Pool`` pages are minified in, or ``None`` to
+    start one when needed.
+    """
+
+    max_pending = None
+    """The most pages waiting for the pool before submitting blocks"""
+
+    def __init__(self, jobs=1, pool=None, max_pending=64):
+        self.jobs, self.pool, self.max_pending = jobs, pool, max_pending
+        self._own_pool = False
+        self._pending = []
+        self._written = 0
+
+    def write(self, dest, html):
+        """
+        Minify the unicode HTML document ``html`` and write it to
+        ``dest`` unless it already has that content, now or in
+        :attr:`pool`. Call :meth:`finish` to wait for the pool.
+
+        """
+        if self.pool is None and self.jobs != 1:
+            jobs = worker_count(self.jobs)
+            logger.debug("Minifying pages with %d workers", jobs)
+            self.pool = multiprocessing.Pool(jobs)
+            self._own_pool = True
+        if self.pool is None:
+            self._written += _minify_and_write((dest, html))
+            return
+        if len(self._pending) >= self.max_pending:
+            self._written += self._pending.pop(0).get()
+        self._pending.append(
+            self.pool.apply_async(_minify_and_write, ((dest, html),))
+        )
+
+    def finish(self):
+        """
+        Wait until every page given to :meth:`write` is written, and
+        return how many of them changed. A pool started by the
+        minifier is stopped.
+
+        """
+        while self._pending:
+            self._written += self._pending.pop(0).get()
+        if self._own_pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool, self._own_pool = None, False
+        written, self._written = self._written, 0
+        return written
+
+
+def _minify_and_write(args):
+    dest, html = args
+    return write_file(dest, minify_html(html), only_if_changed=True)
@@ -1,9 +1,16 @@
 import os
+import re
+import copy
+import time
 import logging
+import posixpath
 
 import jinja2
 
 from attics.settings import parse_config
+from attics.dependencies import (
+    Dependencies, RecordingDict, RecordingEnvironment,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -52,12 +59,36 @@ class Theme(object):
     template = None
     """The ``jinja2.Template`` instance used for rendering pages"""
 
+    fragment_templates = None
+    """
+    A dict of ``jinja2.Template`` instances keyed by the fragment name
+    specified in the ``[fragments]`` section of the config file.
+    """
+
+    variants = None
+    """
+    A dict of the options in the ``[variants]`` section of the config
+    file, setting up the resized variants of images.
+    """
+
+    environment = None
+    """The ``jinja2.Environment`` the templates are loaded from"""
+
+    bytecode_cache = None
+    """
+    The ``jinja2.BytecodeCache`` used to avoid compiling unchanged
+    templates again, or ``None``.
+    """
+
     _themespec = None
     _search_dir = None
+    _stamps = None
 
-    def __init__(self, themespec, search_dir):
+    def __init__(self, themespec, search_dir, bytecode_cache=None):
         self._themespec, self._search_dir = themespec, search_dir
+        self.bytecode_cache = bytecode_cache
         self.images, self.files = {}, {}
+        self.fragment_templates, self.variants = {}, {}
 
     def validate(self):
         self._find_themedir()
@@ -65,32 +96,123 @@ class Theme(object):
         self._parse_template()
         config = parse_config(os.path.join(self.location, 'theme.ini'))
         self.update_files(config, self.location)
+        self._parse_fragments(config)
+        self._stamps = self._stat_sources()
         logger.info("Using theme '%s' at '%s'", self.name, self.location)
 
-    def render_template(self, page, pages, site):
+    def is_current(self):
+        """
+        Return True if the config file and templates of this validated
+        theme haven't changed since it was validated.
+
+        """
+        stamps = self._stamps
+        return stamps is not None and stamps == self._stat_sources()
+
+    def copy(self):
+        """
+        Return a copy of this theme sharing its parsed templates, with
+        its own :attr:`files`, :attr:`images` and :attr:`variants`
+        dicts so that :meth:`update_files` doesn't affect the original.
+
+        """
+        theme = copy.copy(self)
+        theme.files, theme.images = dict(self.files), dict(self.images)
+        theme.variants = dict(self.variants)
+        return theme
+
+    def render_template(self, page, pages, site, fragments=None,
+                        dependencies=None):
         """
         Render :attr:`template` with the images, files, and page
         content and metadata.
 
-        :param page:    the :class:`Page` to render as content
-        :param pages:   a list of :class:`Page` instances to use in
-                        for navigation links
-        :param site:    a dict of strings for use in the template
+        :param page:        the :class:`Page` to render as content
+        :param pages:       a list of :class:`Page` instances to use in
+                            for navigation links
+        :param site:        a dict of strings for use in the template
+        :param fragments:   the dict of :class:`Fragment` instances
+                            returned by :meth:`render_fragments`,
+                            rendered on demand if not given
+        :param dependencies: a :class:`dependencies.Dependencies`
+                            instance to record the templates, ``site``
+                            options, files and images used in
 
         """
-        return self.template.render({
-            'files': self.files,
-            'images': self.images,
-            'pages': pages,
-            'page': page,
-            'site': site,
-        })
+        if fragments is None:
+            fragments = self.render_fragments(pages, site)
+        context = self._page_context(
+            page, pages, site, fragments, dependencies,
+        )
+        self.environment.dependencies = dependencies
+        try:
+            return self.template.render(context)
+        finally:
+            self._finish_recording(fragments, dependencies)
+
+    def generate_template(self, page, pages, site, fragments=None,
+                          dependencies=None):
+        """
+        Like :meth:`render_template`, but return an iterator of unicode
+        chunks rather than building the whole page in memory.
+
+        """
+        if fragments is None:
+            fragments = self.render_fragments(pages, site)
+        context = self._page_context(
+            page, pages, site, fragments, dependencies,
+        )
+        self.environment.dependencies = dependencies
+        try:
+            for chunk in self.template.generate(context):
+                yield chunk
+        finally:
+            self._finish_recording(fragments, dependencies)
+
+    def render_fragments(self, pages, site, timings=None):
+        """
+        Render each of :attr:`fragment_templates` once and return a
+        dict of :class:`Fragment` instances keyed by fragment name.
+
+        Fragments don't have a current page, so instead of ``page``
+        their templates are given ``if_current(otherpage, text)``,
+        which is replaced by ``text`` only when rendering the page
+        ``otherpage``, and a ``root`` placeholder replaced by each
+        page's :attr:`Page.root`.
+
+        If given, the time taken by each template is recorded in the
+        :class:`timing.Timings` instance ``timings``.
+
+        """
+        fragments = {}
+        for name, template in self.fragment_templates.items():
+            dependencies = Dependencies()
+            dependencies.templates.add(template.name)
+            context = {
+                'files': RecordingDict(self.files, dependencies.files),
+                'images': RecordingDict(self.images, dependencies.images),
+                'pages': pages,
+                'site': RecordingDict(site, dependencies.site),
+                'if_current': Fragment.marker,
+                'root': Fragment.root_marker,
+            }
+            started = time.time()
+            self.environment.dependencies = dependencies
+            try:
+                fragments[name] = Fragment(template.render(context))
+            finally:
+                self.environment.dependencies = None
+            fragments[name].dependencies = dependencies
+            if timings is not None:
+                timings.add_template(template.name, time.time() - started)
+        return fragments
 
     def update_files(self, config, base):
         """
         Resolve the image and file paths in ``config`` (relative to
         ``base``) into :class:`Image` and :class:`File` instances
-        and update their respective attributes.
+        and update their respective attributes, and the
+        :attr:`variants` options with the ``[variants]`` section.
 
         """
         for imagespec, imagepath in config.get('images', {}).iteritems():
@@ -99,6 +221,45 @@ class Theme(object):
         for filespec, filepath in config.get('files', {}).iteritems():
             file = File(os.path.join(base, filepath), filespec)
             self.files[filespec] = file
+        self.variants.update(config.get('variants', {}))
+
+    def _page_context(self, page, pages, site, fragments, dependencies):
+        fragments = dict(
+            (name, fragment.for_page(page))
+            for name, fragment in fragments.items()
+        )
+        files, images = self.files, self.images
+        if dependencies is not None:
+            dependencies.templates.add(self.template.name)
+            site = RecordingDict(site, dependencies.site)
+            files = RecordingDict(files, dependencies.files)
+            images = RecordingDict(images, dependencies.images)
+            fragments = RecordingDict(fragments, dependencies.fragments)
+        return {
+            'files': files,
+            'images': images,
+            'pages': pages,
+            'page': page,
+            'site': site,
+            'fragments': fragments,
+            'if_current': lambda other, text: (
+                text if unicode(other) == unicode(page) else u''
+            ),
+            'root': page.root,
+        }
+
+    def _finish_recording(self, fragments, dependencies):
+        """
+        Stop recording the templates loaded, and add the dependencies
+        of the ``fragments`` used to ``dependencies``.
+
+        """
+        self.environment.dependencies = None
+        if dependencies is None:
+            return
+        for name in dependencies.fragments:
+            if name in fragments and fragments[name].dependencies:
+                dependencies.update(fragments[name].dependencies)
 
     def _find_themedir(self):
         """
@@ -121,7 +282,7 @@ class Theme(object):
         logger.debug("Checking '%s'" % themedir)
         if os.path.isdir(themedir):
             logger.info("Found theme at '%s'" % themedir)
-            self.location = themespec
+            self.location = themedir
             self.name = os.path.basename(themespec)
         elif not os.path.dirname(themespec):
             themedir = os.path.join(BUILT_IN_THEMES, themespec)
@@ -164,17 +325,111 @@ class Theme(object):
                 self.template_name
             )
         )
-        env = jinja2.Environment(
+        self.environment = RecordingEnvironment(
             undefined=jinja2.StrictUndefined,
             loader=jinja2.FileSystemLoader(self.location),
+            bytecode_cache=self.bytecode_cache,
         )
-        self.template = env.get_template(self.template_name)
+        self.template = self.environment.get_template(self.template_name)
+
+    def _parse_fragments(self, config):
+        """
+        Parse the templates in the ``[fragments]`` section of the
+        theme's ``config`` into :attr:`fragment_templates`.
+
+        """
+        for name, path in config.get('fragments', {}).items():
+            logger.debug("Loading fragment '%s' from %s", name, path)
+            self.fragment_templates[name] = self.environment.get_template(
+                path
+            )
+
+    def _stat_sources(self):
+        """
+        Return a dict of ``(mtime, size)`` tuples keyed by the path of
+        the config file and each parsed template, or None if one of
+        them is missing.
+
+        """
+        paths = [os.path.join(self.location, self.theme_config_file)]
+        paths.append(self.template.filename)
+        paths.extend(t.filename for t in self.fragment_templates.values())
+        stamps = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            stamps[path] = (st.st_mtime, st.st_size)
+        return stamps
+
+
+class Fragment(object):
+    """
+    The output of a template rendered once and shared by every page,
+    which can still vary by page through :meth:`marker` placeholders.
+
+    """
+
+    root_marker = u'\ue003'
+    """A placeholder replaced by the :attr:`Page.root` of each page"""
+
+    dependencies = None
+    """
+    The :class:`dependencies.Dependencies` of the template rendered,
+    which pages using the fragment depend on too.
+    """
+
+    _marker_pattern = re.compile(
+        u'\ue000([^\ue001]*)\ue001([^\ue002]*)\ue002'
+    )
+
+    def __init__(self, html):
+        # Alternating static text, page path and replacement text
+        self._parts = self._marker_pattern.split(html)
+        self._has_root = self.root_marker in html
+
+    @staticmethod
+    def marker(page, text):
+        """
+        Return a placeholder replaced by ``text`` for ``page`` and
+        removed for every other page.
+
+        """
+        return u'\ue000%s\ue001%s\ue002' % (unicode(page), text)
+
+    def for_page(self, page):
+        """Return the fragment's HTML as rendered for ``page``."""
+        parts = self._parts
+        if len(parts) == 1:
+            html = parts[0]
+        else:
+            path = unicode(page)
+            out = [parts[0]]
+            for i in range(1, len(parts), 3):
+                if parts[i] == path:
+                    out.append(parts[i + 1])
+                out.append(parts[i + 2])
+            html = u''.join(out)
+        if self._has_root:
+            html = html.replace(self.root_marker, page.root)
+        return html
 
 
 class File(object):
-    location = None
-    name = None
-    extn = None
+    """
+    A file copied to the output folder from :attr:`location`, under
+    the name :attr:`name` plus :attr:`extn`.
+
+    If :attr:`fingerprint` is set, it is a hash of the file's content
+    added to its output name.
+
+    Files, images and pages use ``__slots__``, so that sites with very
+    many pages need less memory.
+
+    """
+
+    __slots__ = ('location', 'name', 'extn', 'fingerprint')
 
     def __init__(self, path, name=None):
         if not os.path.isfile(path):
@@ -182,8 +437,11 @@ class File(object):
         self.location = os.path.normpath(path)
         self.extn = os.path.splitext(path)[1]
         self.name = name or os.path.normpath(os.path.basename(path))
+        self.fingerprint = None
 
     def __unicode__(self):
+        if self.fingerprint:
+            return u'%s.%s%s' % (self.name, self.fingerprint, self.extn)
         return self.name + self.extn
 
     def __repr__(self):
@@ -191,19 +449,34 @@ class File(object):
 
 
 class Image(File):
+    __slots__ = ()
+
     def __repr__(self):
         return '<Image %s at %s>' % (self.name, self.location)
 
 
 class Page(File):
-    content = None
-    title = None
-    index = None
+    """
+    A page rendered from the source file at :attr:`location`.
 
-    def __init__(self, path, content, metadata):
+    :attr:`directory` is the folder of the page relative to the input
+    folder, using forward slashes, or an empty string if it is at the
+    top level.
+
+    :attr:`loader`, if set, is called with the page to load its
+    :attr:`content` when it is needed and not loaded.
+
+    """
+
+    __slots__ = ('title', 'index', 'directory', 'loader', '_content')
+
+    def __init__(self, path, content, metadata, directory=u'', loader=None):
         self.location = os.path.normpath(path)
+        self.directory = directory
         self.content = content
+        self.loader = loader
         self.extn = '.html'
+        self.fingerprint = None
         no_ext = os.path.basename(os.path.splitext(path)[0])
         self.name = metadata.get('name', no_ext)
         self.title = metadata.get('title', no_ext)
@@ -219,5 +492,39 @@ class Page(File):
             )
             self.index = 0
 
+    @property
+    def content(self):
+        """
+        The page's HTML content, loaded with :attr:`loader` first if
+        it isn't loaded. Set it to ``None`` to drop it.
+
+        """
+        if self._content is None and self.loader is not None:
+            self._content = self.loader(self)
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
+    @property
+    def content_loaded(self):
+        """True if :attr:`content` is in memory."""
+        return self._content is not None
+
+    @property
+    def root(self):
+        """
+        The relative URL of the output folder from this page, such as
+        ``'../'`` for a page in a folder, or an empty string.
+
+        """
+        if not self.directory:
+            return u''
+        return u'../' * (self.directory.count(u'/') + 1)
+
+    def __unicode__(self):
+        return posixpath.join(self.directory, self.name + self.extn)
+
     def __repr__(self):
         return '<Page %s at %s>' % (self.name, self.location)
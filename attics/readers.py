@@ -1,62 +1,313 @@
 import os
 import os.path
 import io
-import glob
-import itertools
+import re
+import json
+import time
 import logging
+import multiprocessing
 
 import markdown
 
 from attics.models import Page
+from attics.utils import (
+    walk_files, read_ignore_file, worker_count, DEFAULT_IGNORE_PATTERNS,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# Markdown 3 renamed version_info and warns when the old name is used
+MARKDOWN_VERSION = (
+    getattr(markdown, '__version_info__', None) or markdown.version_info
+)
+
+# The header syntax of the Markdown Meta extension
+_meta_re = re.compile(r'^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)')
+_meta_more_re = re.compile(r'^[ ]{4,}(?P<value>.*)')
+_begin_re = re.compile(r'^-{3}(\s.*)?')
+_end_re = re.compile(r'^(-{3}|\.{3})(\s.*)?')
+
+
+def scan_metadata(lines):
+    """
+    Return the metadata dict of the Markdown document whose lines are
+    the iterable of unicode strings ``lines``, parsing its header the
+    way the Meta extension does, without converting the rest.
+
+    Only the lines up to the end of the header are consumed, so
+    ``lines`` can be an open file.
+
+    """
+    meta = {}
+    key = None
+    for number, line in enumerate(lines):
+        line = line.rstrip(u'\r\n').expandtabs(4)
+        if number == 0 and _begin_re.match(line):
+            continue
+        if line.strip() == u'' or _end_re.match(line):
+            break
+        match = _meta_re.match(line)
+        if match:
+            key = match.group('key').lower().strip()
+            meta.setdefault(key, []).append(match.group('value').strip())
+            continue
+        match = _meta_more_re.match(line)
+        if match and key:
+            meta[key].append(match.group('value').strip())
+        else:
+            break
+    return dict((k, ' '.join(v)) for k, v in meta.items())
+
 
 class MarkdownReader(object):
     file_extensions = ['md', 'markdown', 'mkd', 'mdown']
 
-    def __init__(self):
-        self._md = markdown.Markdown(
-            output_format='html5',
-            safe_mode=False,
-            extensions=['meta'],
+    markdown_options = {
+        'output_format': 'html5',
+        'safe_mode': False,
+        'extensions': ['meta'],
+    }
+    """The keyword arguments used to create the Markdown converter"""
+
+    cache = None
+    """
+    The :class:`cache.ConversionCache` used to skip converting
+    unchanged sources, or ``None`` to always convert.
+    """
+
+    page_timings = None
+    """
+    A dict of ``{'read': ..., 'convert': ...}`` dicts with the seconds
+    spent reading and converting each source path since it was last
+    cleared. Cache hits take no time to convert.
+    """
+
+    pool = None
+    """
+    A ``multiprocessing.Pool`` shared with other readers to read files
+    in, or ``None`` to start one each time several files are read.
+    """
+
+    def __init__(self, cache=None, pool=None):
+        self.cache, self.pool = cache, pool
+        self.page_timings = {}
+        self._md = markdown.Markdown(**self.markdown_options)
+        self._fingerprint = json.dumps(
+            [MARKDOWN_VERSION, self.markdown_options],
+            sort_keys=True,
         )
 
-    def _find_files(self, source_dir):
+    def find_files(self, source_dir):
         """
-        Return an iterable of Markdown files in ``source_dir``.
+        Return an iterable of Markdown files in ``source_dir`` and its
+        subfolders.
+
+        Hidden files, editor backup and swap files, and anything
+        matching a pattern in the ``.atticsignore`` file in
+        ``source_dir`` are skipped.
 
         """
-        entries = itertools.chain.from_iterable(
-            glob.glob(os.path.join(source_dir, '*.%s' % ex))
-            for ex in self.file_extensions
-        )
-        for entry in entries:
-            if os.path.isfile(entry):
-                yield entry
+        if not os.path.isdir(source_dir):
+            logger.warning("Input folder '%s' does not exist", source_dir)
+            return
+        patterns = DEFAULT_IGNORE_PATTERNS + read_ignore_file(source_dir)
+        extensions = tuple('.%s' % ex for ex in self.file_extensions)
+        for relpath, entry in walk_files(source_dir, patterns):
+            if entry.name.endswith(extensions):
+                yield entry.path
 
-    def read(self, path):
+    def read(self, path, source_dir=None):
         """
         Read and process a Markdown file from ``path`` and return a
         :class:`models.Page` instance.
 
+        If ``source_dir`` is given, the page is placed in the output
+        folder matching its folder relative to ``source_dir``.
+
         """
         logger.info("Reading '%s'", path)
+        started = time.time()
         with io.open(path, encoding='utf-8') as f:
             raw = f.read()
+        directory = _page_directory(path, source_dir)
+        cached = key = None
+        if self.cache is not None:
+            key = self.cache.key(raw, self._fingerprint)
+            cached = self.cache.get(key)
+        read_done = time.time()
+        if cached is not None:
+            content, metadata = cached
+        else:
+            content, metadata = self.convert(raw)
+            if key is not None:
+                self.cache.put(key, content, metadata)
+        self._add_timing(path, read_done - started, time.time() - read_done)
+        return Page(path, content, metadata, directory)
+
+    def scan(self, path, source_dir=None):
+        """
+        Like :meth:`read`, but only read the metadata header of the
+        file, and return a :class:`models.Page` without content.
+
+        """
+        logger.debug("Scanning '%s'", path)
+        started = time.time()
+        with io.open(path, encoding='utf-8') as f:
+            metadata = scan_metadata(f)
+        self._add_timing(path, time.time() - started, 0.0)
+        directory = _page_directory(path, source_dir)
+        return Page(path, None, metadata, directory, self.load_content)
+
+    def scan_dir(self, source_dir):
+        """
+        Like :meth:`read_dir` without content, but only read the
+        metadata header of each file, which is much faster. The pages'
+        content is read when it is first used.
+
+        """
+        return [self.scan(f, source_dir) for f in self.find_files(source_dir)]
+
+    def load_content(self, page):
+        """
+        Read and convert the source of the :class:`models.Page`
+        ``page`` and return its content.
+
+        This is the :attr:`models.Page.loader` of the pages returned
+        without content.
+
+        """
+        return self.read(page.location).content
+
+    def read_content(self, pages, source_dir, jobs=1):
+        """
+        Read and convert the source of each of the :class:`models.Page`
+        instances in ``pages``, read from ``source_dir``, and set their
+        content, using ``jobs`` worker processes as in :meth:`read_dir`.
+
+        """
+        filenames = [page.location for page in pages]
+        read = self.read_files(filenames, source_dir, jobs)
+        for page, full_page in zip(pages, read):
+            page.content = full_page.content
+
+    def _add_timing(self, path, read, convert):
+        steps = self.page_timings.setdefault(os.path.normpath(path), {})
+        steps['read'] = steps.get('read', 0.0) + read
+        steps['convert'] = steps.get('convert', 0.0) + convert
+
+    def convert(self, raw):
+        """
+        Convert the Markdown string ``raw`` and return a tuple of the
+        HTML content and the metadata dict.
+
+        """
         self._md.reset()
         content = self._md.convert(raw)
         metadata = dict((k, ' '.join(v)) for k, v in self._md.Meta.items())
-        return Page(path, content, metadata)
+        return content, metadata
 
-    def read_dir(self, source_dir):
+    def read_dir(self, source_dir, jobs=1, keep_content=True):
         """
         Read and process Markdown files in ``source_dir`` and return
-        a list of (content, metadata) tuples.
+        a list of :class:`models.Page` instances.
+
+        If ``jobs`` is greater than one, the files are read in that
+        many worker processes, each with its own Markdown converter,
+        or in :attr:`pool` if it is set. If it is zero or less, one
+        worker per CPU is used. The order of the returned list does
+        not depend on ``jobs``.
+
+        If ``keep_content`` is false, the content of each page is
+        dropped as soon as it is read, leaving only its metadata, and
+        is read again when it is first used.
+
+        """
+        filenames = list(self.find_files(source_dir))
+        return self.read_files(filenames, source_dir, jobs, keep_content)
+
+    def read_files(self, filenames, source_dir, jobs=1, keep_content=True):
+        """
+        Like :meth:`read_dir`, but read the Markdown files in the list
+        ``filenames`` found in ``source_dir``, returning the pages in
+        the same order.
 
         """
+        jobs = worker_count(jobs, len(filenames))
+        if jobs <= 1:
+            pages = [
+                _drop_content(self.read(f, source_dir), keep_content)
+                for f in filenames
+            ]
+            return self._set_loaders(pages)
+        tasks = [(f, source_dir, keep_content, self.cache) for f in filenames]
+        if self.pool is not None:
+            logger.debug("Reading %d files in the shared pool", len(tasks))
+            results = self.pool.map(_read_in_worker, tasks)
+        else:
+            logger.debug("Reading %d files with %d workers", len(tasks), jobs)
+            pool = multiprocessing.Pool(jobs)
+            try:
+                results = pool.map(_read_in_worker, tasks)
+            finally:
+                pool.close()
+                pool.join()
         pages = []
-        for filename in self._find_files(source_dir):
-            pages.append(self.read(filename))
+        for page, page_timing in results:
+            self._add_timing(
+                page.location, page_timing['read'], page_timing['convert'],
+            )
+            pages.append(page)
+        return self._set_loaders(pages)
+
+    def _set_loaders(self, pages):
+        for page in pages:
+            if not page.content_loaded:
+                page.loader = self.load_content
         return pages
+
+
+def _page_directory(path, source_dir):
+    """
+    Return the folder of ``path`` relative to ``source_dir`` using
+    forward slashes, or an empty string if it is at the top level or
+    ``source_dir`` is None.
+
+    """
+    if source_dir is None:
+        return u''
+    directory = os.path.relpath(os.path.dirname(path), source_dir)
+    if directory == '.':
+        return u''
+    return directory.replace(os.sep, '/')
+
+
+_worker_readers = {}
+"""The readers of a worker process keyed by their cache's location"""
+
+
+def _worker_reader(cache):
+    """
+    Return the :class:`MarkdownReader` a worker process uses to read
+    files with ``cache``, creating it the first time.
+
+    """
+    location = cache.location if cache is not None else None
+    reader = _worker_readers.get(location)
+    if reader is None:
+        reader = _worker_readers[location] = MarkdownReader(cache)
+    return reader
+
+
+def _read_in_worker(args):
+    path, source_dir, keep_content, cache = args
+    reader = _worker_reader(cache)
+    page = reader.read(path, source_dir)
+    page_timing = reader.page_timings.pop(page.location)
+    return _drop_content(page, keep_content), page_timing
+
+
+def _drop_content(page, keep_content):
+    if not keep_content:
+        page.content = None
+    return page
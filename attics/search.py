@@ -0,0 +1,213 @@
+import os
+import io
+import re
+import json
+import logging
+
+from attics.utils import write_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+SEARCH_DIR = 'search'
+"""The output subfolder the search index is written to"""
+
+INDEX_NAME = 'index.json'
+
+INDEX_VERSION = 1
+
+PREFIX_LENGTH = 2
+"""The number of leading characters of the terms in each shard"""
+
+MIN_TERM_LENGTH = 2
+
+MIN_STEM_LENGTH = 3
+
+STEM_SUFFIXES = [
+    'ational', 'fulness', 'ization', 'ousness', 'iveness', 'ements',
+    'ations', 'ation', 'ement', 'ments', 'ness', 'ment', 'ings', 'able',
+    'ible', 'ful', 'ing', 'ies', 'ied', 'ers', 'est', 'es', 'ed', 'er',
+    'ly', 's',
+]
+"""
+The suffixes stripped from terms, longest first. Only the first one
+found is stripped, and only if :data:`MIN_STEM_LENGTH` characters
+are left.
+"""
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was',
+    'with',
+])
+"""Words too common to be worth indexing"""
+
+_tag_re = re.compile(r'<[^>]*>|&#?\w+;')
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def stem(word):
+    """Return the lowercase ``word`` without its suffix."""
+    for suffix in STEM_SUFFIXES:
+        if (word.endswith(suffix)
+                and len(word) - len(suffix) >= MIN_STEM_LENGTH):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """
+    Return the list of stemmed, lowercase terms in the unicode string
+    ``text``, leaving out stop words and very short words.
+
+    """
+    terms = []
+    for word in _word_re.findall(text.lower()):
+        if len(word) >= MIN_TERM_LENGTH and word not in STOP_WORDS:
+            terms.append(stem(word))
+    return terms
+
+
+def page_terms(page):
+    """
+    Return a dict of the number of times each term appears in the
+    title and the HTML content of the :class:`models.Page` ``page``.
+
+    """
+    counts = {}
+    text = u'%s %s' % (page.title, _tag_re.sub(u' ', page.content or u''))
+    for term in tokenize(text):
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+class SearchIndex(object):
+    """
+    Builds an inverted index of the terms in pages for searching a
+    site in the browser, and writes it as JSON files sharded by the
+    first :data:`PREFIX_LENGTH` characters of the terms, so a search
+    only downloads the shards of the terms it looks for.
+
+    The terms of each page are stored in :attr:`store_path`, if set,
+    along with the hash of its source, so only changed pages are
+    tokenized again.
+
+    """
+
+    store_path = None
+    """
+    The JSON file the terms of each page are kept in between builds,
+    or ``None`` to tokenize every page each time.
+    """
+
+    entries = None
+    """
+    A dict of ``{'hash': ..., 'terms': ...}`` dicts with the source
+    hash and term counts of each page, keyed by source path.
+    """
+
+    def __init__(self, store_path=None):
+        self.store_path = store_path
+        self.entries = {}
+        if store_path is None:
+            return
+        try:
+            with io.open(store_path, encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (IOError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.entries = data['pages']
+
+    def add(self, page, digest):
+        """
+        Index the loaded :class:`models.Page` ``page``, whose source
+        has the hash ``digest``, unless it is already indexed, and
+        return True if it wasn't.
+
+        """
+        entry = self.entries.get(page.location)
+        if entry is not None and entry['hash'] == digest:
+            return False
+        logger.debug("Indexing %s", page.location)
+        self.entries[page.location] = {
+            'hash': digest,
+            'terms': page_terms(page),
+        }
+        return True
+
+    def write(self, output_dir, pages, digests):
+        """
+        Write the index of ``pages``, whose source hashes are in the
+        dict ``digests`` keyed by source path, to the :data:`SEARCH_DIR`
+        folder of ``output_dir``, and save :attr:`store_path`.
+
+        Pages that aren't indexed yet are loaded and indexed first, and
+        the content of those that have a loader is dropped again.
+        Files whose content didn't change are not written again.
+
+        Return a tuple of the list of the index files' paths and the
+        number of them that were written.
+
+        """
+        for page in pages:
+            if self.add(page, digests[page.location]) and (
+                    page.loader is not None):
+                # It is loaded again if another page uses it
+                page.content = None
+        locations = set(page.location for page in pages)
+        for location in list(self.entries):
+            if location not in locations:
+                del self.entries[location]
+        documents = sorted(
+            (unicode(page), page.title, page.location) for page in pages
+        )
+        shards = {}
+        for number, (url, title, location) in enumerate(documents):
+            terms = self.entries[location]['terms']
+            for term, count in terms.items():
+                postings = shards.setdefault(term[:PREFIX_LENGTH], {})
+                postings.setdefault(term, []).append([number, count])
+        index = {
+            'version': INDEX_VERSION,
+            'prefix_length': PREFIX_LENGTH,
+            'min_term_length': MIN_TERM_LENGTH,
+            'min_stem_length': MIN_STEM_LENGTH,
+            'stem_suffixes': STEM_SUFFIXES,
+            'stop_words': sorted(STOP_WORDS),
+            'pages': [[url, title] for url, title, location in documents],
+            'shards': sorted(shards),
+        }
+        search_dir = os.path.join(output_dir, SEARCH_DIR)
+        files = [(os.path.join(search_dir, INDEX_NAME), index)]
+        for prefix, postings in sorted(shards.items()):
+            name = u'terms-%s.json' % prefix
+            files.append((os.path.join(search_dir, name), postings))
+        written = 0
+        for path, data in files:
+            if write_bytes(path, _dump(data), only_if_changed=True):
+                written += 1
+        self.save()
+        logger.info(
+            "Indexed %d pages in %d shards", len(documents), len(shards),
+        )
+        return [path for path, data in files], written
+
+    def save(self):
+        """Save the terms of each page to :attr:`store_path`, if set."""
+        if self.store_path is None:
+            return
+        write_bytes(self.store_path, _dump({
+            'version': INDEX_VERSION,
+            'pages': self.entries,
+        }))
+
+
+def _dump(data):
+    serialized = json.dumps(
+        data, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    )
+    if isinstance(serialized, unicode):
+        serialized = serialized.encode('utf-8')
+    return serialized
@@ -0,0 +1,152 @@
+import os
+import re
+import logging
+import urlparse
+import posixpath
+import threading
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+
+
+logger = logging.getLogger(__name__)
+
+
+RELOAD_PATH = '/__attics__/reload'
+
+RELOAD_TIMEOUT = 30
+"""Seconds a live-reload request waits for a build before returning"""
+
+RELOAD_SCRIPT = u"""<script>
+(function () {
+  var build = %d;
+  function poll() {
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', '%s?build=' + build);
+    xhr.onload = function () {
+      if (xhr.status === 200 && xhr.responseText !== String(build)) {
+        window.location.reload();
+      } else {
+        poll();
+      }
+    };
+    xhr.onerror = function () { setTimeout(poll, 1000); };
+    xhr.send();
+  }
+  poll();
+})();
+</script>
+"""
+
+_body_end = re.compile(u'</body>', re.IGNORECASE)
+
+
+def inject_reload_script(html, build_count):
+    """
+    Return the unicode string ``html`` with the live-reload script
+    for ``build_count`` inserted before the closing body tag, or at
+    the end if there isn't one.
+
+    """
+    script = RELOAD_SCRIPT % (build_count, RELOAD_PATH)
+    match = None
+    for match in _body_end.finditer(html):
+        pass
+    if match is None:
+        return html + script
+    return html[:match.start()] + script + html[match.start():]
+
+
+class LiveReloadHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """
+    Serves files from the server's output directory, adding the
+    live-reload script to HTML pages and answering its requests.
+
+    """
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path == RELOAD_PATH:
+            return self._send_reload(urlparse.parse_qs(url.query))
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if path.endswith('.html') and os.path.isfile(path):
+            return self._send_html(path)
+        return SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+    def translate_path(self, path):
+        path = urlparse.urlparse(path).path
+        parts = [
+            part for part in posixpath.normpath(path).split('/')
+            if part and part not in (os.curdir, os.pardir)
+        ]
+        return os.path.join(self.server.output_dir, *parts)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_html(self, path):
+        with open(path, 'rb') as fp:
+            html = fp.read().decode('utf-8')
+        body = inject_reload_script(html, self.server.watcher.build_count)
+        self._send(body.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def _send_reload(self, query):
+        watcher = self.server.watcher
+        try:
+            seen = int(query.get('build', ['0'])[0])
+        except ValueError:
+            seen = 0
+        with watcher.build_changed:
+            if watcher.build_count == seen:
+                watcher.build_changed.wait(RELOAD_TIMEOUT)
+            count = watcher.build_count
+        self._send(str(count), 'text/plain')
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LiveReloadServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, output_dir, watcher):
+        """
+        :param address:     a ``(host, port)`` tuple to listen on
+        :param output_dir:  the directory to serve files from
+        :param watcher:     the :class:`watch.SiteWatcher` whose builds
+                            trigger reloads
+
+        """
+        self.output_dir, self.watcher = output_dir, watcher
+        BaseHTTPServer.HTTPServer.__init__(self, address, LiveReloadHandler)
+
+
+def serve(watcher, host='localhost', port=8000, interval=0.1):
+    """
+    Build the site with ``watcher``, serve its output directory on
+    ``host`` and ``port``, and rebuild whenever a watched file changes.
+
+    Runs until interrupted.
+
+    """
+    watcher.start()
+    output_dir = watcher.config['attics']['output_path']
+    server = LiveReloadServer((host, port), output_dir, watcher)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logger.warning(
+        "Serving '%s' at http://%s:%d/", output_dir, host, server.server_port,
+    )
+    try:
+        watcher.watch(interval)
+    finally:
+        server.shutdown()
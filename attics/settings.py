@@ -14,6 +14,25 @@ def create_default_settings():
             'output_path': 'output',
             'theme_search': None,
             'theme': 'simple',
+            'jobs': '1',
+            'cache': 'yes',
+            'cache_path': '.attics-cache',
+            'cache_size': '100',
+            'streaming': 'no',
+            'fingerprint_assets': 'no',
+            'copy_strategy': 'copy',
+            'static_path': None,
+            'static_delete': 'no',
+            'search_index': 'no',
+            'sitemap': 'no',
+            'minify_html': 'no',
+            'base_url': None,
+            'compress': 'no',
+            'compress_min_size': '1024',
+            'gzip_level': '9',
+            'brotli_level': '11',
+            'compile_less_css': 'no',
+            'lessc': 'lessc',
         },
         'site': {
             'title': None,
@@ -98,3 +117,73 @@ def merge_dict_of_dicts(*dicts):
             out_inner = out.setdefault(key, {})
             out_inner.update(inner)
     return out
+
+
+BOOLEAN_STATES = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False,
+}
+
+
+def get_bool_option(config, section, option):
+    """
+    Return the value of ``option`` in ``section`` of the dict of
+    dicts ``config`` as a boolean, accepting the same values as
+    ``ConfigParser.getboolean``.
+
+    Raises :class:`ConfigError` if the value is not a valid boolean.
+
+    """
+    value = config[section][option]
+    try:
+        return BOOLEAN_STATES[value.lower()]
+    except (AttributeError, KeyError):
+        raise ConfigError(
+            'Option %s in section [%s] must be yes or no, not %r' % (
+                option,
+                section,
+                value,
+            )
+        )
+
+
+def get_int_option(config, section, option):
+    """
+    Return the value of ``option`` in ``section`` of the dict of
+    dicts ``config`` as an integer.
+
+    Raises :class:`ConfigError` if the value is not a valid integer.
+
+    """
+    value = config[section][option]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ConfigError(
+            'Option %s in section [%s] must be an integer, not %r' % (
+                option,
+                section,
+                value,
+            )
+        )
+
+
+def get_choice_option(config, section, option, choices):
+    """
+    Return the value of ``option`` in ``section`` of the dict of
+    dicts ``config``, which must be one of the strings in ``choices``.
+
+    Raises :class:`ConfigError` if it isn't.
+
+    """
+    value = config[section][option]
+    if value not in choices:
+        raise ConfigError(
+            'Option %s in section [%s] must be one of %s, not %r' % (
+                option,
+                section,
+                ', '.join(choices),
+                value,
+            )
+        )
+    return value
@@ -0,0 +1,107 @@
+import os
+import time
+import urllib
+import logging
+from xml.sax.saxutils import escape
+
+from attics.utils import write_file
+
+
+logger = logging.getLogger(__name__)
+
+
+SITEMAP_NAME = 'sitemap.xml'
+
+MAX_URLS = 50000
+"""The most URLs the sitemap protocol allows in one sitemap file"""
+
+_XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def page_url(base_url, page):
+    """Return the absolute URL of the :class:`models.Page` ``page``."""
+    path = unicode(page).encode('utf-8')
+    return u'%s/%s' % (base_url.rstrip(u'/'), urllib.quote(path, safe='/'))
+
+
+def format_lastmod(mtime):
+    """Return the timestamp ``mtime`` as a W3C datetime in UTC."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(mtime))
+
+
+def sitemap_entries(pages, base_url, mtimes):
+    """
+    Return a list of ``(url, lastmod)`` tuples of ``pages`` sorted by
+    URL, using the source modification times in the dict ``mtimes``
+    keyed by source path.
+
+    """
+    return sorted(
+        (page_url(base_url, page), format_lastmod(mtimes[page.location]))
+        for page in pages
+    )
+
+
+def write_sitemaps(output_dir, base_url, entries, max_urls=MAX_URLS):
+    """
+    Write a sitemap of ``entries``, as returned by
+    :func:`sitemap_entries`, to ``output_dir``.
+
+    If there are more than ``max_urls`` entries, they are split into
+    shards called "sitemap-1.xml" and so on, listed by a sitemap index
+    in "sitemap.xml". Files whose content didn't change are not written
+    again.
+
+    Return a tuple of the list of the written files' paths and the
+    number of them that were written.
+
+    """
+    if len(entries) <= max_urls:
+        files = [(SITEMAP_NAME, _urlset(entries))]
+    else:
+        shards = []
+        for start in range(0, len(entries), max_urls):
+            name = 'sitemap-%d.xml' % (len(shards) + 1)
+            shards.append((name, entries[start:start + max_urls]))
+        files = [(SITEMAP_NAME, _sitemapindex(base_url, shards))]
+        files.extend((name, _urlset(chunk)) for name, chunk in shards)
+    paths, written = [], 0
+    for name, content in files:
+        path = os.path.join(output_dir, name)
+        if write_file(path, content, only_if_changed=True):
+            written += 1
+        paths.append(path)
+    logger.info(
+        "Listed %d pages in %d sitemap files", len(entries), len(files),
+    )
+    return paths, written
+
+
+def _urlset(entries):
+    lines = [
+        u'<?xml version="1.0" encoding="UTF-8"?>',
+        u'<urlset xmlns="%s">' % _XMLNS,
+    ]
+    for url, lastmod in entries:
+        lines.append(
+            u'<url><loc>%s</loc><lastmod>%s</lastmod></url>'
+            % (escape(url), lastmod)
+        )
+    lines.append(u'</urlset>')
+    return u'\n'.join(lines) + u'\n'
+
+
+def _sitemapindex(base_url, shards):
+    lines = [
+        u'<?xml version="1.0" encoding="UTF-8"?>',
+        u'<sitemapindex xmlns="%s">' % _XMLNS,
+    ]
+    for name, entries in shards:
+        url = u'%s/%s' % (base_url.rstrip(u'/'), name)
+        lastmod = max(entry[1] for entry in entries)
+        lines.append(
+            u'<sitemap><loc>%s</loc><lastmod>%s</lastmod></sitemap>'
+            % (escape(url), lastmod)
+        )
+    lines.append(u'</sitemapindex>')
+    return u'\n'.join(lines) + u'\n'
@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+
+import os
+import unittest
+import tempfile
+import shutil
+
+from attics.benchmark import (
+    generate_site, measure_build, measure_import, HEAVY_MODULES,
+)
+from attics.tools import make_configuration
+from attics.timing import PHASES
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_generate_site(self):
+        generate_site(self.workdir, pages=7, assets=2)
+        content = os.listdir(os.path.join(self.workdir, 'content'))
+        assert len([name for name in content if name.endswith('.md')]) == 7
+        assets = os.listdir(os.path.join(self.workdir, 'content', 'assets'))
+        assert len(assets) == 2
+
+    def test_measure_build(self):
+        config_filename = generate_site(self.workdir, pages=5, assets=2)
+        config = make_configuration(
+            config_filename,
+            input_path=os.path.join(self.workdir, 'content'),
+            output_path=os.path.join(self.workdir, 'output'),
+            cache=False,
+        )
+        result = measure_build(config)
+        assert sorted(result['phases']) == sorted(PHASES)
+        assert result['files'] == {
+            'written': 5, 'copied': 3, 'skipped': 0, 'compressed': 0,
+        }
+        assert result['wall'] >= sum(result['phases'].values())
+
+    def test_import_is_fast(self):
+        result = measure_import('attics.tools')
+        loaded = set(name.split('.')[0] for name in result['modules'])
+        assert not loaded & set(HEAVY_MODULES)
+        assert result['seconds'] < 1.0
@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+
+import os
+import io
+import gzip
+import unittest
+import tempfile
+import shutil
+
+from attics.compress import Compressor, gzip_bytes
+
+
+class GzipBytesTestCase(unittest.TestCase):
+    def test_output_only_depends_on_input(self):
+        data = b'content ' * 100
+        assert gzip_bytes(data, 9) == gzip_bytes(data, 9)
+        fp = gzip.GzipFile(fileobj=io.BytesIO(gzip_bytes(data, 9)))
+        assert fp.read() == data
+
+
+class CompressorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.path = os.path.join(self.workdir, 'page.html')
+        self.write(b'<p>content</p>' * 100)
+        self.compressor = Compressor(min_size=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, data):
+        with io.open(self.path, 'wb') as fp:
+            fp.write(data)
+
+    def test_writes_sidecars(self):
+        hashes, written = self.compressor.compress_all([self.path], {})
+        assert written == len(self.compressor.formats)
+        assert list(hashes) == [self.path]
+        assert os.path.isfile(self.path + '.gz')
+
+    def test_skips_unchanged(self):
+        hashes, written = self.compressor.compress_all([self.path], {})
+        assert self.compressor.compress_all([self.path], hashes) == (hashes, 0)
+
+    def test_rewrites_changed(self):
+        hashes, written = self.compressor.compress_all([self.path], {})
+        self.write(b'<p>changed</p>' * 100)
+        new_hashes, written = self.compressor.compress_all([self.path], hashes)
+        assert written == len(self.compressor.formats)
+        assert new_hashes != hashes
+
+    def test_rewrites_sidecars_at_new_level(self):
+        entries, written = self.compressor.compress_all([self.path], {})
+        with io.open(self.path + '.gz', 'rb') as fp:
+            old = fp.read()
+        self.compressor = Compressor(min_size=100, gzip_level=1)
+        new_entries, written = self.compressor.compress_all(
+            [self.path], entries,
+        )
+        assert written == 1
+        assert new_entries[self.path][3]['.gz'] == 1
+        with io.open(self.path + '.gz', 'rb') as fp:
+            assert fp.read() != old
+
+    def test_does_not_hash_unchanged_files(self):
+        entries, written = self.compressor.compress_all([self.path], {})
+        entries[self.path][0] = 'recorded'
+        assert self.compressor.compress_all([self.path], entries) == (
+            entries, 0,
+        )
+
+    def test_skips_small_and_binary_files(self):
+        self.write(b'<p></p>')
+        image = os.path.join(self.workdir, 'image.png')
+        with io.open(image, 'wb') as fp:
+            fp.write(b'\x89PNG' * 100)
+        paths = [self.path, image]
+        assert self.compressor.compress_all(paths, {}, jobs=2) == ({}, 0)
+        assert sorted(os.listdir(self.workdir)) == ['image.png', 'page.html']
+
+    def test_removes_sidecars_of_shrunk_file(self):
+        hashes, written = self.compressor.compress_all([self.path], {})
+        self.write(b'<p></p>')
+        assert self.compressor.compress_all([self.path], hashes) == ({}, 0)
+        assert os.listdir(self.workdir) == ['page.html']
+
+    def test_removes_sidecars_of_dropped_file(self):
+        hashes, written = self.compressor.compress_all([self.path], {})
+        assert self.compressor.compress_all([], hashes) == ({}, 0)
+        assert os.listdir(self.workdir) == ['page.html']
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+
+import os
+import io
+import unittest
+import tempfile
+import shutil
+
+import jinja2
+
+from attics.dependencies import (
+    Dependencies, RecordingDict, RecordingEnvironment, input_state,
+    changed_inputs, ALL_KEYS,
+)
+
+
+class DependenciesTestCase(unittest.TestCase):
+    def test_merge_all(self):
+        merged = Dependencies.merge_all([
+            {'templates': ['layout.html'], 'site': ['title']},
+            {'templates': ['layout.html', 'banner.html']},
+        ])
+        assert merged.to_json() == {
+            'templates': ['banner.html', 'layout.html'],
+            'site': ['title'], 'files': [], 'images': [],
+        }
+
+
+class RecordingDictTestCase(unittest.TestCase):
+    def setUp(self):
+        self.keys = set()
+        self.site = RecordingDict({'title': u'T', 'author': u'A'}, self.keys)
+
+    def test_records_lookups(self):
+        assert self.site['title'] == u'T'
+        assert self.site.get('missing') is None
+        assert self.keys == set(['title', 'missing'])
+
+    def test_records_iteration(self):
+        assert sorted(self.site.items()) == [
+            ('author', u'A'), ('title', u'T'),
+        ]
+        assert ALL_KEYS in self.keys
+
+
+class RecordingEnvironmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.write('layout.html', u'{% include "header.html" %}{{ x }}')
+        self.write('header.html', u'Header ')
+        self.environment = RecordingEnvironment(
+            loader=jinja2.FileSystemLoader(self.workdir),
+        )
+        self.theme = type('Theme', (object,), {
+            'environment': self.environment, 'files': {}, 'images': {},
+        })()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, name, text):
+        with io.open(os.path.join(self.workdir, name), 'w') as fp:
+            fp.write(text)
+
+    def test_records_included_templates(self):
+        dependencies = Dependencies()
+        template = self.environment.get_template('layout.html')
+        self.environment.dependencies = dependencies
+        assert template.render(x=1) == u'Header 1'
+        assert dependencies.templates == set(['header.html'])
+
+    def test_changed_inputs(self):
+        site = {'title': u'T'}
+        names = {'templates': ['header.html', 'gone.html'], 'site': ['title']}
+        state = input_state(self.theme, site, names)
+        assert state['templates']['gone.html'] is None
+        assert changed_inputs(state, self.theme, site) == set()
+        self.write('header.html', u'Other header ')
+        site['title'] = u'Changed'
+        assert changed_inputs(state, self.theme, site) == set([
+            ('templates', 'header.html'), ('site', 'title'),
+        ])
@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+
+import os
+import unittest
+import tempfile
+import shutil
+
+from attics.images import (
+    ImageVariants, PILImage, parse_widths, variant_path,
+)
+
+
+def make_image(path, size):
+    image = PILImage.new('RGB', size, (200, 40, 40))
+    image.save(path)
+
+
+class ParseWidthsTestCase(unittest.TestCase):
+    def test_sorted_and_unique(self):
+        assert parse_widths('960, 480 320,480') == [320, 480, 960]
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_widths, '480 wide')
+        self.assertRaises(ValueError, parse_widths, '0')
+
+    def test_variant_path(self):
+        assert variant_path('photos/cat.jpg', 480) == 'photos/cat-480w.jpg'
+
+
+class RewriteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.variants = ImageVariants([480], None, sizes='50vw')
+        self.variants.srcsets['photos/cat.jpg'] = [
+            (480, 'photos/cat-480w.jpg'), (800, 'photos/cat.jpg'),
+        ]
+
+    def test_adds_srcset(self):
+        html = u'<p><img alt="Cat" src="../photos/cat.jpg" /></p>'
+        assert self.variants.rewrite(html, u'guide') == (
+            u'<p><img alt="Cat" src="../photos/cat.jpg" srcset="'
+            u'../photos/cat-480w.jpg 480w, ../photos/cat.jpg 800w" '
+            u'sizes="50vw" /></p>'
+        )
+
+    def test_leaves_other_images(self):
+        html = (
+            u'<img src="dog.jpg">'
+            u'<img src="photos/cat.jpg" srcset="photos/cat.jpg 1x">'
+        )
+        assert self.variants.rewrite(html) == html
+
+    def test_rewrite_is_idempotent(self):
+        html = self.variants.rewrite(u'<img src="photos/cat.jpg">')
+        assert self.variants.rewrite(html) == html
+
+
+@unittest.skipIf(PILImage is None, 'Pillow is not installed')
+class MakeVariantsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.cache_dir = os.path.join(self.workdir, 'cache')
+        self.images = []
+        sizes = [('wide.jpg', (1000, 500)), ('small.png', (300, 30))]
+        for name, size in sizes:
+            path = os.path.join(self.workdir, name)
+            make_image(path, size)
+            self.images.append((name, path, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_makes_narrower_variants(self):
+        variants = ImageVariants([320, 640], self.cache_dir)
+        files = variants.make(self.images, jobs=2)
+        assert [relpath for cached, relpath in files] == [
+            'wide-320w.jpg', 'wide-640w.jpg',
+        ]
+        assert PILImage.open(files[0][0]).size == (320, 160)
+        assert variants.srcsets == {
+            'wide.jpg': [
+                (320, 'wide-320w.jpg'),
+                (640, 'wide-640w.jpg'),
+                (1000, 'wide.jpg'),
+            ],
+            'small.png': [(300, 'small.png')],
+        }
+
+    def test_cached_variants_not_made_again(self):
+        first = ImageVariants([320], self.cache_dir).make(self.images)
+        os.remove(self.images[0][1])
+        second = ImageVariants([320], self.cache_dir).make(self.images)
+        assert first == second
@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+
+import os
+import io
+import sys
+import unittest
+import tempfile
+import shutil
+
+from attics.less import LessCompiler, find_imports
+
+STUB_COMPILER = u"""\
+import io
+import os
+import sys
+with io.open(os.path.join(os.path.dirname(sys.argv[0]), 'calls'), 'a') as fp:
+    fp.write(u'%s\\n' % sys.argv[1])
+with io.open(sys.argv[1], 'rb') as fp:
+    source = fp.read()
+if b'error' in source:
+    sys.exit(1)
+with io.open(sys.argv[2], 'wb') as fp:
+    fp.write(b'/* compiled */ ' + source)
+"""
+
+
+class FindImportsTestCase(unittest.TestCase):
+    def test_finds_less_imports(self):
+        source = (
+            b'@import "vars";\n'
+            b'@import (reference) \'mixins.less\';\n'
+            b'@import url("parts/grid.less");\n'
+            b'@import "reset.css";\n'
+            b'@import "http://example.com/theme.less";\n'
+        )
+        path = os.path.join('styles', 'main.less')
+        assert find_imports(path, source) == [
+            os.path.join('styles', 'vars.less'),
+            os.path.join('styles', 'mixins.less'),
+            os.path.join('styles', 'parts', 'grid.less'),
+        ]
+
+
+class LessCompilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        stub = os.path.join(self.workdir, 'lessc.py')
+        self.write(stub, STUB_COMPILER)
+        self.compiler = LessCompiler(
+            '"%s" "%s"' % (sys.executable, stub),
+            os.path.join(self.workdir, 'cache'),
+        )
+        self.styles = [
+            os.path.join(self.workdir, name) for name in ('a.less', 'b.less')
+        ]
+        self.write(self.styles[0], u'@import "vars";\na { color: @c; }\n')
+        self.write(self.styles[1], u'b { color: red; }\n')
+        self.vars = os.path.join(self.workdir, 'vars.less')
+        self.write(self.vars, u'@c: red;\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, path, text):
+        with io.open(path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+
+    def calls(self):
+        path = os.path.join(self.workdir, 'calls')
+        if not os.path.isfile(path):
+            return []
+        with io.open(path, encoding='utf-8') as fp:
+            return sorted(fp.read().split())
+
+    def test_compiles_in_parallel(self):
+        assert self.compiler.compile_all(self.styles, jobs=2) == 2
+        assert self.calls() == self.styles
+        with io.open(os.path.join(self.workdir, 'b.css')) as fp:
+            assert fp.read() == u'/* compiled */ b { color: red; }\n'
+
+    def test_unchanged_not_compiled_again(self):
+        self.compiler.compile_all(self.styles)
+        os.remove(os.path.join(self.workdir, 'calls'))
+        os.remove(os.path.join(self.workdir, 'b.css'))
+        assert self.compiler.compile_all(self.styles) == 2
+        assert self.calls() == []
+        assert os.path.isfile(os.path.join(self.workdir, 'b.css'))
+
+    def test_changed_import_compiled_again(self):
+        self.compiler.compile_all(self.styles)
+        os.remove(os.path.join(self.workdir, 'calls'))
+        self.write(self.vars, u'@c: blue;\n')
+        self.compiler.compile_all(self.styles)
+        assert self.calls() == [self.styles[0]]
+
+    def test_unchanged_output_not_replaced(self):
+        compiler = LessCompiler(self.compiler.command)
+        compiler.compile_all(self.styles)
+        css = os.path.join(self.workdir, 'b.css')
+        os.utime(css, (1, 1))
+        assert compiler.compile_all(self.styles) == 2
+        assert os.path.getmtime(css) == 1
+
+    def test_failure_not_cached(self):
+        self.write(self.styles[1], u'error')
+        assert self.compiler.compile_all(self.styles) == 1
+        assert self.compiler.compile_all(self.styles) == 1
+        assert self.calls().count(self.styles[1]) == 2
+
+    def test_missing_compiler(self):
+        compiler = LessCompiler(os.path.join(self.workdir, 'missing'))
+        assert compiler.compile_all(self.styles) == 0
@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+
+import os
+import io
+import unittest
+import tempfile
+import shutil
+
+from attics.minify import HTMLMinifier, minify_html
+
+
+class MinifyHTMLTestCase(unittest.TestCase):
+    def test_collapses_whitespace_and_strips_comments(self):
+        html = (
+            u'<!DOCTYPE html>\n<html>\n  <head>\n    <title> Home </title>\n'
+            u'  </head>\n  <body>\n    <!-- navigation -->\n'
+            u'    <ul>\n      <li><a href="a.html">A</a>  and\n   B</li>\n'
+            u'    </ul>\n  </body>\n</html>\n'
+        )
+        assert minify_html(html) == (
+            u'<!DOCTYPE html><html><head><title>Home</title><body>'
+            u'<ul><li><a href="a.html">A</a> and B</ul>'
+        )
+
+    def test_keeps_preformatted_content(self):
+        html = (
+            u'<div>\n<pre>  a\n    <!-- b --></pre>\n'
+            u'<textarea>\n  c</textarea>\n<script>\n  if (a  < b) {}'
+            u'</script>\n<!--[if IE]> old <![endif]--></div>'
+        )
+        assert minify_html(html) == (
+            u'<div><pre>  a\n    <!-- b --></pre> '
+            u'<textarea>\n  c</textarea> <script>\n  if (a  < b) {}'
+            u'</script> <!--[if IE]> old <![endif]--></div>'
+        )
+
+
+class HTMLMinifierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_writes_in_parallel(self):
+        minifier = HTMLMinifier(jobs=2, max_pending=1)
+        paths = [os.path.join(self.workdir, '%d.html' % i) for i in range(3)]
+        for path in paths:
+            minifier.write(path, u'<p>\n  Page\n</p>\n')
+        assert minifier.finish() == 3
+        assert minifier.pool is None
+        with io.open(paths[2], encoding='utf-8') as fp:
+            assert fp.read() == u'<p>Page</p>'
+        minifier = HTMLMinifier()
+        minifier.write(paths[0], u'<p>Page</p>')
+        assert minifier.finish() == 0
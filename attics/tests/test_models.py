@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
 import os.path
+import sys
+import pickle
 import unittest
 
-from attics.models import Theme, File, Image, Page, BUILT_IN_THEMES
+from attics.models import (
+    Theme, File, Page, Fragment, BUILT_IN_THEMES,
+)
 
 
 testdata_dir = os.path.join(
@@ -11,6 +15,7 @@ testdata_dir = os.path.join(
     'testdata'
 )
 
+
 class IsolateThemeTestCase(unittest.TestCase):
     def test__find_themedir_builtin(self):
         t = Theme('simple', 'bogus')
@@ -21,13 +26,15 @@ class IsolateThemeTestCase(unittest.TestCase):
     def test__find_themedir_custom(self):
         t = Theme('customtheme', testdata_dir)
         t._find_themedir()
-        assert t.location == 'customtheme'
+        assert t.location == os.path.join(testdata_dir, 'customtheme')
         assert t.name == 'customtheme'
 
     def test__find_themedir_custom_path(self):
         t = Theme('themes/deepercustom', testdata_dir)
         t._find_themedir()
-        assert t.location == 'themes/deepercustom'
+        assert t.location == os.path.join(
+            testdata_dir, 'themes/deepercustom',
+        )
         assert t.name == 'deepercustom'
 
     def test__validate_files_builtin(self):
@@ -49,3 +56,77 @@ class IsolateThemeTestCase(unittest.TestCase):
         t = Theme('simple', 'bogus')
         t.location = os.path.join(BUILT_IN_THEMES, 'simple')
         t._parse_template()
+
+
+class FragmentTestCase(unittest.TestCase):
+    def make_page(self, name):
+        return Page('%s.md' % name, u'', {'name': name})
+
+    def test_static_fragment(self):
+        fragment = Fragment(u'<ul></ul>')
+        assert fragment.for_page(self.make_page('a')) == u'<ul></ul>'
+
+    def test_marker_only_for_current_page(self):
+        a, b = self.make_page('a'), self.make_page('b')
+        fragment = Fragment(u''.join([
+            u'<li%s>a</li>' % Fragment.marker(a, u' class="x"'),
+            u'<li%s>b</li>' % Fragment.marker(b, u' class="x"'),
+        ]))
+        assert fragment.for_page(a) == u'<li class="x">a</li><li>b</li>'
+        assert fragment.for_page(b) == u'<li>a</li><li class="x">b</li>'
+
+    def test_render_with_shared_fragments(self):
+        t = Theme('simple', 'bogus')
+        t.validate()
+        pages = [self.make_page('a'), self.make_page('b')]
+        site = {'title': u'Site'}
+        fragments = t.render_fragments(pages, site)
+        html = t.render_template(pages[1], pages, site, fragments)
+        assert u'<li class="current"><a href="b.html">' in html
+        assert u'<li><a href="a.html">' in html
+        assert html == t.render_template(pages[1], pages, site)
+
+
+class PageTestCase(unittest.TestCase):
+    def make_page(self, loader=None):
+        metadata = {'title': u'Introduction', 'index': '2'}
+        return Page('guide/intro.md', None, metadata, u'guide', loader)
+
+    def test_content_loaded_on_demand(self):
+        loads = []
+
+        def loader(page):
+            loads.append(page)
+            return u'<p>intro</p>'
+
+        page = self.make_page(loader)
+        assert not page.content_loaded
+        assert page.content == u'<p>intro</p>'
+        assert page.content == u'<p>intro</p>'
+        assert loads == [page]
+        page.content = None
+        assert not page.content_loaded
+        assert page.content == u'<p>intro</p>'
+        assert len(loads) == 2
+
+    def test_content_without_loader(self):
+        assert self.make_page().content is None
+
+    def test_pickle(self):
+        page = self.make_page()
+        page.content = u'<p>intro</p>'
+        copied = pickle.loads(pickle.dumps(page, 2))
+        assert unicode(copied) == u'guide/intro.html'
+        assert copied.content == u'<p>intro</p>'
+
+    def test_slotted_page_is_smaller(self):
+        class PlainPage(object):
+            pass
+
+        page = self.make_page()
+        plain = PlainPage()
+        for name in File.__slots__ + Page.__slots__:
+            setattr(plain, name, getattr(page, name))
+        assert not hasattr(page, '__dict__')
+        plain_size = sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+        assert sys.getsizeof(page) * 2 < plain_size
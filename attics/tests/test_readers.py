@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+
+import os.path
+import io
+import unittest
+import tempfile
+import shutil
+
+from attics.readers import MarkdownReader, scan_metadata
+from attics.cache import ConversionCache
+
+
+class ReadDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.srcdir = tempfile.mkdtemp(prefix='attics_test')
+        for i in range(6):
+            path = os.path.join(self.srcdir, 'page%d.md' % i)
+            with io.open(path, 'w', encoding='utf-8') as fp:
+                fp.write(u'Title: Page %d\nIndex: %d\n\n# Page %d\n' % (
+                    i, 6 - i, i,
+                ))
+
+    def tearDown(self):
+        shutil.rmtree(self.srcdir)
+
+    def summarize(self, pages):
+        return [
+            (p.location, p.name, p.title, p.index, p.content)
+            for p in pages
+        ]
+
+    def test_read_dir_serial(self):
+        pages = MarkdownReader().read_dir(self.srcdir)
+        assert len(pages) == 6
+        assert sorted(p.title for p in pages) == [
+            'Page %d' % i for i in range(6)
+        ]
+
+    def test_read_dir_without_content(self):
+        pages = MarkdownReader().read_dir(
+            self.srcdir, jobs=2, keep_content=False,
+        )
+        assert len(pages) == 6
+        assert not any(p.content_loaded for p in pages)
+        assert pages[0].content == u'<h1>%s</h1>' % pages[0].title
+
+    def test_read_dir_parallel_matches_serial(self):
+        reader = MarkdownReader()
+        serial = reader.read_dir(self.srcdir, jobs=1)
+        parallel = reader.read_dir(self.srcdir, jobs=3)
+        assert self.summarize(parallel) == self.summarize(serial)
+
+
+class ScanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.srcdir = tempfile.mkdtemp(prefix='attics_test')
+        for i in range(4):
+            path = os.path.join(self.srcdir, 'page%d.md' % i)
+            with io.open(path, 'w', encoding='utf-8') as fp:
+                fp.write(u'Title: Page %d\nIndex: %d\n\n# Page %d\n' % (
+                    i, 4 - i, i,
+                ))
+
+    def tearDown(self):
+        shutil.rmtree(self.srcdir)
+
+    def test_scan_metadata_matches_conversion(self):
+        reader = MarkdownReader()
+        for raw in [
+            u'Title: Caf\xe9\nIndex: 3\nName: home\n\nBody: text\n',
+            u'---\nTitle: Fenced\n---\nTitle: body\n',
+            u'title: Multi\n    line\n\tvalue\nindex: x\n',
+            u'Title: Short\nnot metadata\nIndex: 2\n',
+            u'# No metadata\n\nTitle: body\n',
+            u'',
+        ]:
+            metadata = scan_metadata(io.StringIO(raw))
+            assert metadata == reader.convert(raw)[1], raw
+
+    def test_scan_dir(self):
+        reader = MarkdownReader()
+        scanned = reader.scan_dir(self.srcdir)
+        assert not any(p.content_loaded for p in scanned)
+        read = reader.read_dir(self.srcdir)
+        assert [(p.location, p.title, p.index) for p in scanned] == [
+            (p.location, p.title, p.index) for p in read
+        ]
+
+    def test_read_content(self):
+        reader = MarkdownReader()
+        pages = reader.scan_dir(self.srcdir)
+        reader.read_content(pages[1:], self.srcdir, jobs=2)
+        assert not pages[0].content_loaded
+        for page in pages[1:]:
+            assert page.content == u'<h1>%s</h1>' % page.title
+
+
+class ConversionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.cache = ConversionCache(os.path.join(self.workdir, 'cache'), 1024)
+        self.source = os.path.join(self.workdir, 'page.md')
+        with io.open(self.source, 'w', encoding='utf-8') as fp:
+            fp.write(u'Title: Cached\n\nSome *text*\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_hit_skips_conversion(self):
+        first = MarkdownReader(self.cache).read(self.source)
+        reader = MarkdownReader(self.cache)
+        reader.convert = None
+        second = reader.read(self.source)
+        assert second.content == first.content
+        assert second.title == u'Cached'
+
+    def test_prune_evicts_least_recently_used(self):
+        self.cache.put('aa01', u'x' * 500, {})
+        self.cache.put('bb02', u'y' * 500, {})
+        os.utime(self.cache._entry_path('aa01'), (0, 0))
+        self.cache.put('cc03', u'z' * 500, {})
+        self.cache.prune()
+        assert self.cache.get('aa01') is None
+        assert self.cache.get('cc03') is not None
+
+
+class FindFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.srcdir = tempfile.mkdtemp(prefix='attics_test')
+        for relpath in [
+            'index.md', 'notes.txt', '.hidden.md', 'index.md~',
+            '.index.md.swp', 'drafts/wip.md', 'guide/intro.md',
+            'guide/deeper/more.markdown', '.git/info.md',
+        ]:
+            path = os.path.join(self.srcdir, *relpath.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with io.open(path, 'w', encoding='utf-8') as fp:
+                fp.write(u'Title: %s\n' % relpath)
+        with io.open(os.path.join(self.srcdir, '.atticsignore'), 'w') as fp:
+            fp.write(u'# unpublished\ndrafts\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.srcdir)
+
+    def test_find_files(self):
+        found = MarkdownReader().find_files(self.srcdir)
+        relpaths = sorted(os.path.relpath(p, self.srcdir) for p in found)
+        assert relpaths == [
+            os.path.join('guide', 'deeper', 'more.markdown'),
+            os.path.join('guide', 'intro.md'),
+            'index.md',
+        ]
+
+    def test_nested_page_paths(self):
+        pages = MarkdownReader().read_dir(self.srcdir)
+        by_path = dict((unicode(p), p) for p in pages)
+        assert sorted(by_path) == [
+            u'guide/deeper/more.html', u'guide/intro.html', u'index.html',
+        ]
+        assert by_path[u'index.html'].root == u''
+        assert by_path[u'guide/deeper/more.html'].root == u'../../'
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+
+import os
+import io
+import json
+import unittest
+import tempfile
+import shutil
+
+from attics.models import Page
+from attics.search import SearchIndex, tokenize, stem
+
+
+class TokenizeTestCase(unittest.TestCase):
+    def test_stems_and_skips_stop_words(self):
+        assert tokenize(u'The Cats were jumping on a table, 2 times') == [
+            u'cat', u'were', u'jump', u'table', u'tim',
+        ]
+
+    def test_short_stems_kept(self):
+        assert stem(u'is') == u'is'
+        assert stem(u'bed') == u'bed'
+        assert stem(u'beds') == u'bed'
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.store = os.path.join(self.workdir, 'search.json')
+        self.pages = [
+            Page(u'b.md', u'<p>Cats and <em>dogs</em></p>', {'title': u'B'}),
+            Page(u'a.md', u'<p>Catalogs &amp; cats</p>', {'title': u'A'}),
+        ]
+        self.digests = {u'a.md': u'1', u'b.md': u'2'}
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read(self, name):
+        path = os.path.join(self.workdir, 'search', name)
+        with io.open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+
+    def test_writes_sharded_index(self):
+        index = SearchIndex(self.store)
+        paths, written = index.write(self.workdir, self.pages, self.digests)
+        assert written == len(paths) == 3
+        assert self.read('index.json')['pages'] == [
+            [u'a.html', u'A'], [u'b.html', u'B'],
+        ]
+        assert self.read('index.json')['shards'] == [u'ca', u'do']
+        assert self.read('terms-ca.json') == {
+            u'cat': [[0, 1], [1, 1]],
+            u'catalog': [[0, 1]],
+        }
+
+    def test_drops_loaded_content(self):
+        page = Page(u'c.md', None, {'title': u'C'},
+                    loader=lambda page: u'<p>Loaded cats</p>')
+        self.digests[u'c.md'] = u'3'
+        SearchIndex().write(self.workdir, [page], self.digests)
+        assert not page.content_loaded
+        assert u'cat' in self.read('terms-ca.json')
+        assert not os.path.exists(self.store)
+
+    def test_unchanged_pages_not_tokenized(self):
+        SearchIndex(self.store).write(self.workdir, self.pages, self.digests)
+        index = SearchIndex(self.store)
+        assert not index.add(self.pages[0], u'2')
+        assert index.add(self.pages[1], u'changed')
+
+    def test_unchanged_shards_not_written(self):
+        SearchIndex(self.store).write(self.workdir, self.pages, self.digests)
+        self.pages[0].content = u'<p>Cats and birds</p>'
+        self.digests[u'b.md'] = u'3'
+        index = SearchIndex(self.store)
+        paths, written = index.write(self.workdir, self.pages, self.digests)
+        assert written == 2
+        assert self.read('index.json')['shards'] == [u'bi', u'ca']
@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+
+import os
+import io
+import unittest
+import tempfile
+import shutil
+import threading
+import urllib2
+
+from attics.server import (
+    LiveReloadServer, inject_reload_script, RELOAD_PATH,
+)
+
+
+class InjectReloadScriptTestCase(unittest.TestCase):
+    def test_before_closing_body(self):
+        html = inject_reload_script(u'<body>text</BODY></html>', 3)
+        assert html.startswith(u'<body>text<script>')
+        assert html.endswith(u'</script>\n</BODY></html>')
+        assert u'var build = 3;' in html
+
+    def test_without_body(self):
+        html = inject_reload_script(u'text', 0)
+        assert html.startswith(u'text<script>')
+
+
+class FakeWatcher(object):
+    build_count = 5
+
+    def __init__(self):
+        self.build_changed = threading.Condition()
+
+
+class LiveReloadServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp(prefix='attics_test')
+        with io.open(os.path.join(self.outdir, 'index.html'), 'w') as fp:
+            fp.write(u'<body>home</body>')
+        self.server = LiveReloadServer(
+            ('localhost', 0), self.outdir, FakeWatcher(),
+        )
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://localhost:%d' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.outdir)
+
+    def test_serves_page_with_script(self):
+        body = urllib2.urlopen(self.url + '/').read()
+        assert body.startswith('<body>home<script>')
+
+    def test_reload_returns_newer_build(self):
+        body = urllib2.urlopen(self.url + RELOAD_PATH + '?build=4').read()
+        assert body == '5'
@@ -5,7 +5,9 @@ import io
 import textwrap
 import ConfigParser
 
-from attics.settings import config_to_dict, merge_dict_of_dicts
+from attics.settings import (
+    config_to_dict, merge_dict_of_dicts, get_int_option, ConfigError,
+)
 
 
 class ConfigToDictTestCase(unittest.TestCase):
@@ -124,3 +126,14 @@ class UpdateDictOfDictsTestCase(unittest.TestCase):
         }
         merged = merge_dict_of_dicts(first, second)
         assert merged == result
+
+
+class GetIntOptionTestCase(unittest.TestCase):
+    def test_valid(self):
+        assert get_int_option({'attics': {'jobs': '4'}}, 'attics', 'jobs') == 4
+
+    def test_invalid(self):
+        config = {'attics': {'jobs': 'many'}}
+        self.assertRaises(
+            ConfigError, get_int_option, config, 'attics', 'jobs',
+        )
@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+
+import os
+import io
+import unittest
+import tempfile
+import shutil
+
+from attics.models import Page
+from attics.sitemap import (
+    sitemap_entries, write_sitemaps, page_url, format_lastmod,
+)
+
+
+class SitemapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.pages = [
+            Page(u'b.md', None, {}, u'guide'),
+            Page(u'a & b.md', None, {}),
+            Page(u'c.md', None, {}),
+        ]
+        self.mtimes = {u'b.md': 0, u'a & b.md': 86400, u'c.md': 0}
+        self.base_url = u'https://example.com/docs/'
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read(self, name):
+        with io.open(os.path.join(self.workdir, name)) as fp:
+            return fp.read()
+
+    def test_page_url(self):
+        assert page_url(self.base_url, self.pages[1]) == (
+            u'https://example.com/docs/a%20%26%20b.html'
+        )
+        assert format_lastmod(86400) == '1970-01-02T00:00:00Z'
+
+    def test_single_sitemap(self):
+        entries = sitemap_entries(self.pages, self.base_url, self.mtimes)
+        paths, written = write_sitemaps(self.workdir, self.base_url, entries)
+        assert written == 1
+        assert paths == [os.path.join(self.workdir, 'sitemap.xml')]
+        sitemap = self.read('sitemap.xml')
+        assert sitemap.index(u'a%20%26%20b.html') < sitemap.index(u'c.html')
+        assert (
+            u'<url><loc>https://example.com/docs/guide/b.html</loc>'
+            u'<lastmod>1970-01-01T00:00:00Z</lastmod></url>'
+        ) in sitemap
+
+    def test_split_into_index(self):
+        entries = sitemap_entries(self.pages, self.base_url, self.mtimes)
+        paths, written = write_sitemaps(
+            self.workdir, self.base_url, entries, max_urls=2,
+        )
+        assert written == 3
+        index = self.read('sitemap.xml')
+        assert u'<sitemapindex' in index
+        assert (
+            u'<sitemap><loc>https://example.com/docs/sitemap-1.xml</loc>'
+            u'<lastmod>1970-01-02T00:00:00Z</lastmod></sitemap>'
+        ) in index
+        assert u'guide/b.html' not in self.read('sitemap-1.xml')
+        self.mtimes[u'b.md'] = 60
+        entries = sitemap_entries(self.pages, self.base_url, self.mtimes)
+        paths, written = write_sitemaps(
+            self.workdir, self.base_url, entries, max_urls=2,
+        )
+        assert written == 2
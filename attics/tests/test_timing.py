@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+
+import os
+import json
+import unittest
+import tempfile
+import shutil
+
+from attics.timing import Timings, PAGE_STEPS, format_report
+from attics.tools import run, make_configuration
+
+testdata_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'testdata'
+)
+
+
+class TimingsTestCase(unittest.TestCase):
+    def test_report_orders_slowest_first(self):
+        timings = Timings()
+        timings.add_page('fast.md', 'convert', 0.1)
+        timings.add_page('slow.md', 'convert', 0.5)
+        timings.add_page('slow.md', 'render', 0.2)
+        timings.add_template('layout.html', 0.3)
+        timings.add_template('layout.html', 0.3)
+        report = timings.report(limit=1)
+        assert [p['page'] for p in report['slowest_pages']] == ['slow.md']
+        assert abs(report['slowest_pages'][0]['total'] - 0.7) < 1e-9
+        assert report['slowest_templates'][0]['renders'] == 2
+        json.dumps(report)
+        assert 'slow.md' in format_report(report)
+
+    def test_run_records_pages_and_templates(self):
+        outdir = tempfile.mkdtemp(prefix='attics_test')
+        try:
+            config = make_configuration(
+                os.path.join(testdata_dir, 'site.ini'),
+                input_path=os.path.join(testdata_dir, 'content'),
+                output_path=outdir,
+                cache=False,
+            )
+            timings = Timings()
+            run(config, timings)
+        finally:
+            shutil.rmtree(outdir)
+        page = os.path.join(testdata_dir, 'content', 'main.md')
+        assert sorted(timings.pages[page]) == sorted(PAGE_STEPS)
+        assert timings.templates['layout.html'][0] == 1
+        assert timings.templates['navigation.html'][0] == 1
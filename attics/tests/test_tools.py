@@ -1,11 +1,23 @@
 from __future__ import absolute_import
 
 import os.path
+import io
+import sys
+import re
+import json
 import unittest
 import tempfile
 import shutil
 
-from attics.tools import run, make_configuration
+from attics.tools import (
+    run, make_configuration, load_theme, scan_pages, format_page_list,
+    build_many, format_site_summary, read_sites_file,
+)
+from attics.readers import MarkdownReader
+from attics.settings import ConfigError
+from attics.images import PILImage
+from attics.tests.test_images import make_image
+from attics.tests.test_less import STUB_COMPILER
 
 testdata_dir = os.path.join(
     os.path.dirname(os.path.abspath(__file__)),
@@ -25,5 +37,390 @@ class AtticsTestCase(unittest.TestCase):
             os.path.join(testdata_dir, 'site.ini'),
             input_path=None,
             output_path=self.outdir,
+            cache=False,
         )
         run(config)
+
+
+class IncrementalBuildTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.indir = os.path.join(self.workdir, 'content')
+        self.outdir = os.path.join(self.workdir, 'output')
+        shutil.copytree(os.path.join(testdata_dir, 'content'), self.indir)
+        os.mkdir(self.outdir)
+        self.config = make_configuration(
+            os.path.join(testdata_dir, 'site.ini'),
+            input_path=self.indir,
+            output_path=self.outdir,
+        )
+        self.config['attics']['cache_path'] = os.path.join(
+            self.workdir, 'cache',
+        )
+        run(self.config)
+        self.output_page = os.path.join(self.outdir, 'main.html')
+        self.original = self.read(self.output_page)
+        self.write(self.output_page, u'sentinel')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, path, text):
+        with io.open(path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+
+    def read(self, path):
+        with io.open(path, encoding='utf-8') as fp:
+            return fp.read()
+
+    def test_unchanged_page_not_rendered(self):
+        stats = run(self.config)
+        assert self.read(self.output_page) == u'sentinel'
+        assert stats == {
+            'written': 0, 'copied': 0, 'skipped': 2, 'compressed': 0,
+        }
+
+    def test_changed_page_rendered(self):
+        self.write(
+            os.path.join(self.indir, 'main.md'),
+            u'title: Main\n\nThis is only a changed test\n',
+        )
+        run(self.config)
+        assert u'only a changed test' in self.read(self.output_page)
+
+    def test_config_change_renders_all(self):
+        self.config['site']['title'] = 'Another Title'
+        run(self.config)
+        assert u'Another Title' in self.read(self.output_page)
+
+    def test_nested_page(self):
+        os.mkdir(os.path.join(self.indir, 'guide'))
+        self.write(
+            os.path.join(self.indir, 'guide', 'intro.md'),
+            u'title: Intro\n',
+        )
+        run(self.config)
+        nested = self.read(os.path.join(self.outdir, 'guide', 'intro.html'))
+        assert u'href="../stylesheet.css"' in nested
+        assert u'href="../main.html"' in nested
+        assert u'href="guide/intro.html"' in self.read(self.output_page)
+
+    def test_streaming_matches_normal_build(self):
+        self.config['attics']['streaming'] = 'yes'
+        os.remove(self.output_page)
+        run(self.config)
+        assert self.read(self.output_page) == self.original
+
+    def test_fingerprint_assets(self):
+        self.config['attics']['fingerprint_assets'] = 'yes'
+        stats = run(self.config)
+        with io.open(os.path.join(self.outdir, 'asset-manifest.json')) as fp:
+            names = json.load(fp)
+        hashed = names['stylesheet.css']
+        assert re.match(r'^stylesheet\.[0-9a-f]{8}\.css$', hashed)
+        assert os.path.isfile(os.path.join(self.outdir, hashed))
+        assert u'href="%s"' % hashed in self.read(self.output_page)
+        assert stats == {
+            'written': 2, 'copied': 1, 'skipped': 0, 'compressed': 0,
+        }
+        assert run(self.config) == {
+            'written': 0, 'copied': 0, 'skipped': 3, 'compressed': 0,
+        }
+
+    def test_compress(self):
+        self.config['attics']['compress'] = 'yes'
+        self.config['attics']['compress_min_size'] = '0'
+        stats = run(self.config)
+        assert stats['compressed'] >= 2
+        assert os.path.isfile(self.output_page + '.gz')
+        assert run(self.config)['compressed'] == 0
+
+    def test_compress_level_change(self):
+        self.config['attics']['compress'] = 'yes'
+        self.config['attics']['compress_min_size'] = '0'
+        self.config['attics']['gzip_level'] = '1'
+        first = run(self.config)['compressed']
+        self.config['attics']['gzip_level'] = '9'
+        stats = run(self.config)
+        assert stats['written'] == 0
+        assert 0 < stats['compressed'] <= first
+        self.config['attics']['compress'] = 'no'
+        run(self.config)
+        assert not os.path.exists(self.output_page + '.gz')
+
+    def test_compile_less_css(self):
+        stub = os.path.join(self.workdir, 'lessc.py')
+        self.write(stub, STUB_COMPILER)
+        self.write(os.path.join(self.indir, 'extra.less'), u'a { }\n')
+        self.config['attics']['compile_less_css'] = 'yes'
+        self.config['attics']['lessc'] = '"%s" "%s"' % (sys.executable, stub)
+        self.config['files'] = {'extra': 'extra.css'}
+        run(self.config)
+        assert self.read(os.path.join(self.outdir, 'extra.css')) == (
+            u'/* compiled */ a { }\n'
+        )
+
+    def test_unchanged_pages_not_converted(self):
+        self.config['attics']['cache'] = 'no'
+        convert = MarkdownReader.convert
+        MarkdownReader.convert = None
+        try:
+            run(self.config)
+        finally:
+            MarkdownReader.convert = convert
+        assert self.read(self.output_page) == u'sentinel'
+
+    def test_list_pages(self):
+        pages = scan_pages(self.config)
+        assert not any(page.content_loaded for page in pages)
+        assert format_page_list(pages) == (
+            u'    0  main.html                       Main\n'
+        )
+
+    def test_copy_strategy(self):
+        extra = os.path.join(self.indir, 'extra.css')
+        self.write(extra, u'a { }')
+        self.config['files'] = {'extra': 'extra.css'}
+        self.config['attics']['copy_strategy'] = 'hardlink'
+        run(self.config)
+        dest = os.path.join(self.outdir, 'extra.css')
+        assert os.path.samefile(extra, dest)
+        assert run(self.config)['copied'] == 0
+        os.remove(dest)
+        assert run(self.config)['copied'] == 1
+
+    def test_invalid_copy_strategy(self):
+        self.config['attics']['copy_strategy'] = 'teleport'
+        self.assertRaises(ConfigError, run, self.config)
+
+    def test_static_path(self):
+        static_dir = os.path.join(self.workdir, 'static')
+        for relpath in [u'robots.txt', u'files/a.pdf', u'files/old/b.pdf']:
+            path = os.path.join(static_dir, *relpath.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            self.write(path, relpath)
+        self.config['attics']['static_path'] = static_dir
+        self.config['attics']['static_delete'] = 'yes'
+        self.config['attics']['jobs'] = '2'
+        assert run(self.config)['copied'] == 3
+        mirrored = os.path.join(self.outdir, 'files', 'old', 'b.pdf')
+        assert self.read(mirrored) == u'files/old/b.pdf'
+        assert run(self.config)['copied'] == 0
+        os.remove(os.path.join(static_dir, 'files', 'old', 'b.pdf'))
+        stats = run(self.config)
+        assert stats['copied'] == 0 and stats['skipped'] == 4
+        assert not os.path.exists(mirrored)
+        assert os.path.isfile(os.path.join(self.outdir, 'robots.txt'))
+
+    @unittest.skipIf(PILImage is None, 'Pillow is not installed')
+    def test_image_variants(self):
+        static_dir = os.path.join(self.workdir, 'static')
+        os.makedirs(os.path.join(static_dir, 'photos'))
+        make_image(os.path.join(static_dir, 'photos', 'cat.jpg'), (800, 600))
+        self.write(
+            os.path.join(self.indir, 'cat.md'),
+            u'title: Cat\n\n![Cat](photos/cat.jpg)\n',
+        )
+        self.config['attics']['static_path'] = static_dir
+        self.config['variants'] = {'widths': '320 480 1200'}
+        run(self.config)
+        page = self.read(os.path.join(self.outdir, 'cat.html'))
+        assert (
+            u'srcset="photos/cat-320w.jpg 320w, photos/cat-480w.jpg 480w, '
+            u'photos/cat.jpg 800w" sizes="100vw"'
+        ) in page
+        for name in ['cat-320w.jpg', 'cat-480w.jpg']:
+            assert os.path.isfile(os.path.join(self.outdir, 'photos', name))
+        assert not os.path.exists(
+            os.path.join(self.outdir, 'photos', 'cat-1200w.jpg')
+        )
+        assert run(self.config)['written'] == 0
+        self.config['variants']['widths'] = '320'
+        run(self.config)
+        page = self.read(os.path.join(self.outdir, 'cat.html'))
+        assert u'photos/cat-480w.jpg' not in page
+
+    @unittest.skipIf(PILImage is None, 'Pillow is not installed')
+    def test_invalid_variant_widths(self):
+        self.config['attics']['static_path'] = self.indir
+        self.config['variants'] = {'widths': 'wide'}
+        self.assertRaises(ConfigError, run, self.config)
+
+    def test_search_index(self):
+        self.config['attics']['search_index'] = 'yes'
+        stats = run(self.config)
+        assert self.read(self.output_page) == u'sentinel'
+        search_dir = os.path.join(self.outdir, 'search')
+        with io.open(os.path.join(search_dir, 'index.json')) as fp:
+            assert json.load(fp)['pages'] == [[u'main.html', u'Main']]
+        assert stats['written'] == len(os.listdir(search_dir))
+        assert run(self.config)['written'] == 0
+        self.write(
+            os.path.join(self.indir, 'main.md'),
+            u'title: Main\n\nZebras\n',
+        )
+        run(self.config)
+        assert os.path.isfile(os.path.join(search_dir, 'terms-ze.json'))
+        assert not os.path.exists(os.path.join(search_dir, 'terms-te.json'))
+
+    def test_pruning_keeps_search_index(self):
+        self.config['attics']['search_index'] = 'yes'
+        self.config['attics']['cache_size'] = '0'
+        run(self.config)
+        cache_dir = os.path.join(self.workdir, 'cache')
+        assert os.path.isfile(os.path.join(cache_dir, 'search.json'))
+        assert os.listdir(os.path.join(cache_dir, 'markdown')) != []
+        assert run(self.config)['written'] == 0
+
+    def test_sitemap(self):
+        self.config['attics']['sitemap'] = 'yes'
+        self.assertRaises(ConfigError, run, self.config)
+        self.config['attics']['base_url'] = 'http://example.com'
+        stats = run(self.config)
+        assert stats['written'] == 1
+        assert u'<loc>http://example.com/main.html</loc>' in self.read(
+            os.path.join(self.outdir, 'sitemap.xml')
+        )
+        assert run(self.config)['written'] == 0
+
+    def test_minify_html(self):
+        self.config['attics']['minify_html'] = 'yes'
+        self.config['attics']['jobs'] = '2'
+        self.write(os.path.join(self.indir, 'other.md'), u'title: Other\n')
+        assert run(self.config)['written'] == 2
+        minified = self.read(self.output_page)
+        assert len(minified) < len(self.original)
+        assert u'\n' not in minified
+        assert run(self.config)['written'] == 0
+
+    def test_new_page_renders_all(self):
+        self.write(os.path.join(self.indir, 'other.md'), u'title: Other\n')
+        run(self.config)
+        assert u'Other' in self.read(self.output_page)
+
+    def test_unused_site_option_renders_nothing(self):
+        self.config['site']['author'] = 'Someone'
+        assert run(self.config)['written'] == 0
+        assert self.read(self.output_page) == u'sentinel'
+
+    def test_changed_include_renders_dependent_pages(self):
+        themedir = os.path.join(self.workdir, 'theme')
+        os.mkdir(themedir)
+        self.write(os.path.join(themedir, 'theme.ini'), u'')
+        self.write(
+            os.path.join(themedir, 'layout.html'),
+            u'{{ page.title }}{% if page.title == "Main" %}'
+            u'{% include "banner.html" %}{% endif %}',
+        )
+        self.write(os.path.join(themedir, 'banner.html'), u' banner')
+        self.write(os.path.join(self.indir, 'other.md'), u'title: Other\n')
+        self.config['attics']['theme'] = themedir
+        assert run(self.config)['written'] == 2
+        self.write(os.path.join(themedir, 'banner.html'), u' new banner')
+        stats = run(self.config)
+        assert stats['written'] == 1
+        assert stats['skipped'] == 1
+        assert self.read(self.output_page) == u'Main new banner'
+
+
+class LoadThemeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.themedir = os.path.join(self.workdir, 'customtheme')
+        shutil.copytree(
+            os.path.join(testdata_dir, 'customtheme'), self.themedir,
+        )
+        self.config = make_configuration(
+            os.path.join(testdata_dir, 'site.ini'),
+            input_path=self.workdir,
+            output_path=self.workdir,
+        )
+        self.config['attics']['theme'] = self.themedir
+        self.config['attics']['cache_path'] = os.path.join(
+            self.workdir, 'cache',
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_reuses_unchanged_theme(self):
+        first = load_theme(self.config)
+        second = load_theme(self.config)
+        assert first is not second
+        assert first.template is second.template
+        assert first.files is not second.files
+
+    def test_reloads_changed_theme(self):
+        first = load_theme(self.config)
+        with io.open(os.path.join(self.themedir, 'layout.html'), 'w') as fp:
+            fp.write(u'<!-- Changed template -->')
+        second = load_theme(self.config)
+        assert first.template is not second.template
+        assert second.template.render() == u'<!-- Changed template -->'
+
+    def test_stores_compiled_templates(self):
+        load_theme(self.config)
+        bytecode_dir = os.path.join(self.workdir, 'cache', 'jinja2')
+        assert len(os.listdir(bytecode_dir)) == 1
+
+
+class BuildManyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.configs = []
+        for name in ['one', 'two']:
+            sitedir = os.path.join(self.workdir, name)
+            shutil.copytree(
+                os.path.join(testdata_dir, 'content'),
+                os.path.join(sitedir, 'content'),
+            )
+            config = os.path.join(sitedir, 'site.ini')
+            with io.open(config, 'w', encoding='utf-8') as fp:
+                fp.write(u'[site]\ntitle: Site %s\n' % name)
+            self.configs.append(config)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_builds_each_site(self):
+        results = build_many(self.configs, jobs=2)
+        assert [result['error'] for result in results] == [None, None]
+        for name in ['one', 'two']:
+            path = os.path.join(self.workdir, name, 'output', 'main.html')
+            with io.open(path, encoding='utf-8') as fp:
+                assert u'Site %s' % name in fp.read()
+
+    def test_custom_theme_from_another_folder(self):
+        sitedir = os.path.dirname(self.configs[0])
+        shutil.copytree(
+            os.path.join(testdata_dir, 'customtheme'),
+            os.path.join(sitedir, 'mytheme'),
+        )
+        with io.open(self.configs[0], 'a', encoding='utf-8') as fp:
+            fp.write(u'[attics]\ntheme: mytheme\n')
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            results = build_many(self.configs, jobs=1)
+        finally:
+            os.chdir(cwd)
+        assert [result['error'] for result in results] == [None, None]
+        stylesheet = os.path.join(sitedir, 'output', 'stylesheet.css')
+        assert os.path.isfile(stylesheet)
+
+    def test_failure_does_not_stop_others(self):
+        missing = os.path.join(self.workdir, 'missing', 'site.ini')
+        results = build_many([missing] + self.configs, jobs=1)
+        assert results[0]['stats'] is None and results[0]['error']
+        assert results[2]['stats']['written'] == 1
+        summary = format_site_summary(results)
+        assert summary.endswith(u'2 sites built, 1 failed in %.3fs\n' % (
+            sum(result['seconds'] for result in results),
+        ))
+
+    def test_reads_sites_file(self):
+        sites_file = os.path.join(self.workdir, 'sites.txt')
+        with io.open(sites_file, 'w', encoding='utf-8') as fp:
+            fp.write(u'# Sites\none/site.ini\n\ntwo/site.ini\n')
+        assert read_sites_file(sites_file) == self.configs
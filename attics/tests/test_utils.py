@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+
+import os
+import io
+import unittest
+import tempfile
+import shutil
+
+from attics.utils import write_file, write_chunks, copy_file
+
+
+class WriteFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.path = os.path.join(self.workdir, 'page.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read(self):
+        with io.open(self.path, encoding='utf-8') as fp:
+            return fp.read()
+
+    def test_writes_new_file(self):
+        assert write_file(self.path, u'caf\xe9', only_if_changed=True)
+        assert self.read() == u'caf\xe9'
+        assert os.listdir(self.workdir) == ['page.html']
+
+    def test_skips_unchanged(self):
+        write_file(self.path, u'content')
+        os.utime(self.path, (0, 0))
+        assert not write_file(self.path, u'content', only_if_changed=True)
+        assert os.path.getmtime(self.path) == 0
+
+    def test_rewrites_changed(self):
+        write_file(self.path, u'content')
+        assert write_file(self.path, u'contenT', only_if_changed=True)
+        assert self.read() == u'contenT'
+
+    def test_always_writes_by_default(self):
+        write_file(self.path, u'content')
+        assert write_file(self.path, u'content')
+
+
+class WriteChunksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.path = os.path.join(self.workdir, 'page.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_writes_and_skips_unchanged(self):
+        chunks = [u'<p>', u'caf\xe9', u'</p>']
+        assert write_chunks(self.path, iter(chunks), only_if_changed=True)
+        os.utime(self.path, (0, 0))
+        assert not write_chunks(self.path, iter(chunks), only_if_changed=True)
+        assert os.path.getmtime(self.path) == 0
+        assert os.listdir(self.workdir) == ['page.html']
+        with io.open(self.path, encoding='utf-8') as fp:
+            assert fp.read() == u'<p>caf\xe9</p>'
+
+
+class CopyFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.src = os.path.join(self.workdir, 'src.css')
+        self.dest = os.path.join(self.workdir, 'dest.css')
+        write_file(self.src, u'body {}')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_copies_and_skips_unchanged(self):
+        assert copy_file(self.src, self.dest, only_if_changed=True)
+        assert not copy_file(self.src, self.dest, only_if_changed=True)
+        write_file(self.src, u'body {x}')
+        assert copy_file(self.src, self.dest, only_if_changed=True)
+        assert sorted(os.listdir(self.workdir)) == ['dest.css', 'src.css']
+
+    def test_hardlink(self):
+        assert copy_file(self.src, self.dest, True, 'hardlink')
+        assert os.path.samefile(self.src, self.dest)
+        assert not copy_file(self.src, self.dest, True, 'hardlink')
+        assert copy_file(self.src, self.dest, True, 'copy')
+        assert not os.path.samefile(self.src, self.dest)
+
+    def test_symlink(self):
+        assert copy_file(self.src, self.dest, True, 'symlink')
+        assert os.readlink(self.dest) == os.path.abspath(self.src)
+        assert not copy_file(self.src, self.dest, True, 'symlink')
+
+    def test_reflink_falls_back_to_copy(self):
+        assert copy_file(self.src, self.dest, True, 'reflink')
+        assert not os.path.islink(self.dest)
+        with io.open(self.dest, encoding='utf-8') as fp:
+            assert fp.read() == u'body {}'
+        assert not copy_file(self.src, self.dest, True, 'reflink')
+        assert sorted(os.listdir(self.workdir)) == ['dest.css', 'src.css']
+
+    def test_folder_created_by_another_thread(self):
+        makedirs = os.makedirs
+
+        def racing_makedirs(path, *args):
+            # Another thread creates the folder after it was found missing
+            makedirs(path)
+            makedirs(path, *args)
+
+        dest = os.path.join(self.workdir, 'new', 'dest.css')
+        os.makedirs = racing_makedirs
+        try:
+            assert copy_file(self.src, dest)
+        finally:
+            os.makedirs = makedirs
+        assert os.path.isfile(dest)
@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+
+import os
+import io
+import sys
+import unittest
+import tempfile
+import shutil
+
+from attics.tools import make_configuration
+from attics.watch import SiteWatcher, changed_paths
+from attics.tests.test_less import STUB_COMPILER
+
+testdata_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'testdata'
+)
+
+
+class ChangedPathsTestCase(unittest.TestCase):
+    def test_changed_paths(self):
+        old = {'same': (1, 1), 'modified': (1, 1), 'removed': (1, 1)}
+        new = {'same': (1, 1), 'modified': (2, 1), 'added': (1, 1)}
+        assert changed_paths(old, new) == set(['modified', 'removed', 'added'])
+
+
+class SiteWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='attics_test')
+        self.indir = os.path.join(self.workdir, 'content')
+        self.outdir = os.path.join(self.workdir, 'output')
+        shutil.copytree(os.path.join(testdata_dir, 'content'), self.indir)
+        os.mkdir(self.outdir)
+        self.config_filename = os.path.join(testdata_dir, 'site.ini')
+        self.overrides = {}
+        self.watcher = SiteWatcher(self.config_filename, self.make_config)
+        self.watcher.start()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def make_config(self):
+        config = make_configuration(
+            self.config_filename,
+            input_path=self.indir,
+            output_path=self.outdir,
+            cache=False,
+        )
+        for section, options in self.overrides.items():
+            config.setdefault(section, {}).update(options)
+        return config
+
+    def write(self, path, text):
+        with io.open(path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+
+    def read(self, path):
+        with io.open(path, encoding='utf-8') as fp:
+            return fp.read()
+
+    def test_poll_without_changes(self):
+        assert not self.watcher.poll()
+        assert self.watcher.build_count == 1
+
+    def test_poll_rebuilds_changed_page(self):
+        self.write(
+            os.path.join(self.indir, 'main.md'),
+            u'title: Main\n\nEdited while watching\n',
+        )
+        assert self.watcher.poll()
+        assert self.watcher.build_count == 2
+        output = self.read(os.path.join(self.outdir, 'main.html'))
+        assert u'Edited while watching' in output
+
+    def test_ignored_files_do_not_trigger_rebuilds(self):
+        self.write(os.path.join(self.indir, '.main.md.swp'), u'swap')
+        self.write(os.path.join(self.indir, 'main.md~'), u'backup')
+        assert not self.watcher.poll()
+        assert self.watcher.build_count == 1
+
+    def test_poll_adds_and_removes_pages(self):
+        other = os.path.join(self.indir, 'other.md')
+        self.write(other, u'title: Other\n')
+        assert self.watcher.poll()
+        assert u'Other' in self.read(os.path.join(self.outdir, 'main.html'))
+        os.remove(other)
+        assert self.watcher.poll()
+        assert u'Other' not in self.read(
+            os.path.join(self.outdir, 'main.html')
+        )
+
+    def test_compiled_css_does_not_trigger_rebuilds(self):
+        stub = os.path.join(self.workdir, 'lessc.py')
+        self.write(stub, STUB_COMPILER)
+        self.write(os.path.join(self.indir, 'extra.less'), u'a { }\n')
+        self.overrides = {
+            'attics': {
+                'compile_less_css': 'yes',
+                'lessc': '"%s" "%s"' % (sys.executable, stub),
+            },
+            'files': {'extra': 'extra.css'},
+        }
+        self.watcher = SiteWatcher(self.config_filename, self.make_config)
+        self.watcher.start()
+        self.write(
+            os.path.join(self.indir, 'main.md'),
+            u'title: Main\n\nEdited while watching\n',
+        )
+        assert self.watcher.poll()
+        assert not self.watcher.poll()
+        self.write(os.path.join(self.indir, 'extra.less'), u'b { }\n')
+        assert self.watcher.poll()
+        assert self.read(os.path.join(self.outdir, 'extra.css')) == (
+            u'/* compiled */ b { }\n'
+        )
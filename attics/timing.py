@@ -0,0 +1,132 @@
+import time
+import contextlib
+
+
+PHASES = [
+    'less', 'theme', 'read', 'sort', 'images', 'render', 'write', 'index',
+    'copy', 'compress',
+]
+"""The names of the build phases timed by :class:`Timings`, in order"""
+
+PAGE_STEPS = ['read', 'convert', 'render', 'write']
+"""The names of the steps timed for each page, in order"""
+
+
+class Timings(object):
+    """
+    Accumulates the time spent in each phase of a build, and in each
+    step of handling each page and rendering each template.
+
+    """
+
+    phases = None
+    """A dict of the total seconds spent in each phase, by name"""
+
+    pages = None
+    """
+    A dict of dicts of the seconds spent in each of
+    :data:`PAGE_STEPS`, keyed by page source path.
+    """
+
+    templates = None
+    """
+    A dict of ``[count, seconds]`` lists with the number of renders
+    and the total time spent rendering each template, by name.
+    """
+
+    def __init__(self):
+        self.phases = dict((name, 0.0) for name in PHASES)
+        self.pages, self.templates = {}, {}
+
+    @contextlib.contextmanager
+    def phase(self, name, page=None, template=None):
+        """
+        Return a context manager adding the time spent inside it to
+        the phase ``name``, and if given, to the step of the same name
+        for the source path ``page`` and to the template ``template``.
+
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            if page is not None:
+                self.add_page(page, name, elapsed)
+            if template is not None:
+                self.add_template(template, elapsed)
+
+    def add_page(self, page, step, seconds):
+        """Add ``seconds`` to ``step`` of the page at source path ``page``."""
+        steps = self.pages.setdefault(page, {})
+        steps[step] = steps.get(step, 0.0) + seconds
+
+    def merge_pages(self, page_timings):
+        """
+        Add the steps in ``page_timings``, a dict like :attr:`pages`,
+        to :attr:`pages`.
+
+        """
+        for page, steps in page_timings.items():
+            for step, seconds in steps.items():
+                self.add_page(page, step, seconds)
+
+    def add_template(self, template, seconds):
+        """Record a render of ``template`` that took ``seconds``."""
+        entry = self.templates.setdefault(template, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def report(self, limit=10):
+        """
+        Return a dict with the phase times, and the ``limit`` slowest
+        pages and templates, ready to be serialized as JSON.
+
+        """
+        pages = []
+        for page, steps in self.pages.items():
+            entry = dict((step, steps.get(step, 0.0)) for step in PAGE_STEPS)
+            entry['page'] = page
+            entry['total'] = sum(steps.values())
+            pages.append(entry)
+        pages.sort(key=lambda entry: entry['total'], reverse=True)
+        templates = [
+            {'template': name, 'renders': count, 'total': seconds}
+            for name, (count, seconds) in self.templates.items()
+        ]
+        templates.sort(key=lambda entry: entry['total'], reverse=True)
+        return {
+            'phases': self.phases,
+            'total': sum(self.phases.values()),
+            'slowest_pages': pages[:limit],
+            'slowest_templates': templates[:limit],
+        }
+
+
+def format_report(report):
+    """
+    Return the dict returned by :meth:`Timings.report` formatted as a
+    human readable table.
+
+    """
+    lines = ['Phases:']
+    for name in PHASES:
+        lines.append('  %-10s %9.3fs' % (name, report['phases'][name]))
+    lines.append('  %-10s %9.3fs' % ('total', report['total']))
+    lines.append('Slowest pages:')
+    for entry in report['slowest_pages']:
+        steps = ', '.join(
+            '%s %.3fs' % (step, entry[step]) for step in PAGE_STEPS
+        )
+        lines.append(
+            '  %9.3fs  %s (%s)' % (entry['total'], entry['page'], steps)
+        )
+    lines.append('Slowest templates:')
+    for entry in report['slowest_templates']:
+        lines.append('  %9.3fs  %s (%d renders)' % (
+            entry['total'],
+            entry['template'],
+            entry['renders'],
+        ))
+    return '\n'.join(lines)
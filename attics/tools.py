@@ -2,35 +2,51 @@ from __future__ import absolute_import
 
 import os.path
 import sys
+import copy
+import time
+import json
 import argparse
 import logging
-import pprint
 import textwrap
-import shlex
-import subprocess
 
+# Modules that import Markdown, Jinja2, Pillow, multiprocessing or
+# subprocess are imported where they are used, so that commands which
+# don't build anything, or fail early, start quickly
 from attics.settings import (
     parse_config, create_default_settings, merge_dict_of_dicts,
+    get_int_option, get_bool_option, get_choice_option, ConfigError,
+)
+from attics.cache import ConversionCache
+from attics.manifest import BuildManifest, config_digest, theme_digest
+from attics.timing import Timings, PHASES, format_report
+from attics.search import SearchIndex
+from attics.utils import (
+    copy_file, open_file, write_file, write_chunks, file_digest, walk_files,
+    read_ignore_file, worker_count, COPY_STRATEGIES, DEFAULT_IGNORE_PATTERNS,
 )
-from attics.readers import MarkdownReader
-from attics.models import Theme
-from attics.utils import copy_file, write_file
 
 
 logger = logging.getLogger(__name__)
 
+ASSET_MANIFEST_NAME = 'asset-manifest.json'
+
+FINGERPRINT_LENGTH = 8
+"""The number of hex digits of the content hash in fingerprinted names"""
+
+PATH_OPTIONS = ['input_path', 'output_path', 'cache_path', 'static_path']
+"""The options of the ``[attics]`` section that are paths"""
+
+_loaded_themes = {}
+"""Validated themes keyed by :func:`theme_key`"""
+
 
 def main():
     args = parse_args()
     setup_logger(args.verbosity)
     try:
-        config = make_configuration(
-            args.config,
-            args.input_path,
-            args.output_path
-        )
-        logger.debug("Using configuration:\n%s" % pprint.pformat(config))
-        run(config)
+        run_command(args)
+    except KeyboardInterrupt:
+        logger.info("Interrupted, exiting")
     except Exception as e:
         if logger.getEffectiveLevel() == logging.DEBUG:
             logger.exception("Caught exception, traceback:")
@@ -41,82 +57,1025 @@ def main():
         sys.exit(1)
 
 
-def run(config):
-    input_dir = config['attics']['input_path']
-    output_dir = config['attics']['output_path']
+def run_command(args):
+    """Run the command selected by the parsed arguments ``args``."""
+    def make_config():
+        config = make_configuration(
+            args.config,
+            args.input_path,
+            args.output_path,
+            args.jobs,
+            args.cache,
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            import pprint
+            logger.debug("Using configuration:\n%s", pprint.pformat(config))
+        return config
+
+    if args.list_pages:
+        pages = scan_pages(make_config())
+        sys.stdout.write(format_page_list(pages).encode('utf-8'))
+        return
+    if args.command == 'build-many':
+        config_files = list(args.sites)
+        if args.sites_file:
+            config_files.extend(read_sites_file(args.sites_file))
+        results = build_many(config_files, args.jobs, args.cache)
+        sys.stdout.write(format_site_summary(results).encode('utf-8'))
+        if any(result['error'] is not None for result in results):
+            sys.exit(1)
+        return
+    if args.command == 'build' and not args.watch:
+        run_build(args, make_config())
+        return
+    # Imported here since attics.watch depends on this module
+    from attics.watch import SiteWatcher
+    from attics.server import serve
+    watcher = SiteWatcher(args.config, make_config)
+    if args.command == 'serve':
+        serve(watcher, args.host, args.port)
+    else:
+        watcher.start()
+        watcher.watch()
+
+
+def run_build(args, config):
+    """
+    Build the site described by ``config`` once, profiling the build
+    and printing timing statistics if the parsed arguments ``args``
+    ask for it.
+
+    """
+    timings = Timings()
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(run, config, timings)
+        profiler.dump_stats(args.profile)
+        logger.info("Wrote profile to %s", args.profile)
+    else:
+        run(config, timings)
+    if args.stats:
+        report = timings.report(args.stats_limit)
+        if args.stats == 'json':
+            output = json.dumps(report, indent=2, sort_keys=True)
+        else:
+            output = format_report(report)
+        sys.stdout.write(output + '\n')
+
+
+def build_many(config_files, jobs=None, cache=None):
+    """
+    Build the site of each of the config files in ``config_files`` in
+    turn, sharing one pool of ``jobs`` worker processes (one per CPU
+    if not given or zero) and the validated themes between them.
+
+    Relative paths in each config file are taken from its folder, so
+    the sites can be built from anywhere.
+
+    A site that fails to build is logged and skipped. Return a list of
+    dicts with the ``'config'`` file, the ``'seconds'`` its build took,
+    the ``'stats'`` returned by :func:`run`, or ``None`` if it failed,
+    and the ``'error'`` message, or ``None`` if it didn't.
+
+    """
+    import multiprocessing
+    jobs = worker_count(jobs or 0)
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    results = []
+    try:
+        for config_file in config_files:
+            logger.info("Building site '%s'", config_file)
+            result = {'config': config_file, 'stats': None, 'error': None}
+            started = time.time()
+            try:
+                config = make_configuration(
+                    config_file, jobs=jobs, cache=cache,
+                )
+                resolve_paths(config, os.path.dirname(config_file))
+                result['stats'] = run(config, pool=pool)
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logger.debug("Traceback:", exc_info=True)
+                logger.error("Failed to build '%s': %s", config_file, e)
+                result['error'] = unicode(e) or e.__class__.__name__
+            result['seconds'] = time.time() - started
+            results.append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def resolve_paths(config, base):
+    """
+    Make the relative paths of the :data:`PATH_OPTIONS` in ``config``
+    relative to the folder ``base`` instead of the current folder.
 
-    theme = Theme(config['attics']['theme'], config['attics']['theme_search'])
-    theme.validate()
+    """
+    options = config['attics']
+    for option in PATH_OPTIONS:
+        if options[option] and not os.path.isabs(options[option]):
+            options[option] = os.path.join(base, options[option])
+
+
+def read_sites_file(path):
+    """
+    Return the list of config files listed in the file ``path``, one
+    per line, relative to its folder. Blank lines and lines starting
+    with ``#`` are skipped.
+
+    """
+    base = os.path.dirname(path)
+    with open_file(path) as fp:
+        lines = [line.strip() for line in fp]
+    return [
+        os.path.join(base, line) for line in lines
+        if line and not line.startswith(u'#')
+    ]
+
+
+def format_site_summary(results):
+    """
+    Return a table of the outcome, build time and file counts of each
+    of the ``results`` of :func:`build_many`, one per line, followed
+    by the totals.
+
+    """
+    lines = []
+    for result in results:
+        stats = result['stats']
+        if stats is None:
+            outcome = u'failed: %s' % result['error']
+        else:
+            outcome = u'written %d, copied %d, skipped %d' % (
+                stats['written'], stats['copied'], stats['skipped'],
+            )
+        lines.append(u'%-6s %9.3fs  %-30s  %s\n' % (
+            u'ok' if stats is not None else u'FAIL',
+            result['seconds'],
+            result['config'],
+            outcome,
+        ))
+    failed = sum(1 for result in results if result['stats'] is None)
+    lines.append(u'%d sites built, %d failed in %.3fs\n' % (
+        len(results) - failed,
+        failed,
+        sum(result['seconds'] for result in results),
+    ))
+    return u''.join(lines)
+
+
+def run(config, timings=None, pool=None):
+    """
+    Build the site described by ``config`` and return a dict with the
+    number of files ``'written'``, ``'copied'`` and ``'skipped'``.
+
+    If given, the time spent in each phase is added to the
+    :class:`Timings` instance ``timings``, and source files are read
+    in the shared ``multiprocessing.Pool`` ``pool``.
+
+    """
+    if timings is None:
+        timings = Timings()
+    with timings.phase('less'):
+        compile_less_css(config)
+    with timings.phase('theme'):
+        theme = load_theme(config)
+    from attics.readers import MarkdownReader
+    reader = MarkdownReader(make_cache(config), pool)
+    pages = scan_pages(config, reader, timings)
+    previous = BuildManifest.load(config['attics']['output_path'])
+    manifest, stats = build(config, theme, pages, previous, reader, timings)
+    if reader.cache is not None:
+        reader.cache.prune()
+    logger.info("Phase times: %s", ', '.join(
+        '%s %.3fs' % (name, timings.phases[name]) for name in PHASES
+    ))
+    return stats
+
+
+def load_theme(config):
+    """
+    Return the validated :class:`Theme` described by ``config``, with
+    the user's files and images applied.
+
+    Validated themes are kept for the life of the process, so later
+    builds with an unchanged theme, of the same site or not, skip
+    parsing its templates.
+
+    """
+    themespec = config['attics']['theme']
+    search_dir = config['attics']['theme_search']
+    bytecode_dir = None
+    if get_bool_option(config, 'attics', 'cache'):
+        bytecode_dir = os.path.join(config['attics']['cache_path'], 'jinja2')
+    # The bytecode cache isn't part of the key since it only speeds up
+    # parsing, which a theme that is reused doesn't need
+    key = theme_key(themespec, search_dir)
+    theme = _loaded_themes.get(key)
+    if theme is None or not theme.is_current():
+        from attics.models import Theme
+        theme = Theme(themespec, search_dir, make_bytecode_cache(bytecode_dir))
+        theme.validate()
+        _loaded_themes[key] = theme
+    else:
+        logger.info("Reusing theme '%s' at '%s'", theme.name, theme.location)
+    theme = theme.copy()
     theme.update_files(config, config['attics']['input_path'])
+    return theme
+
+
+def theme_key(themespec, search_dir):
+    """
+    Return the key the theme ``themespec`` found from ``search_dir`` is
+    kept under in :data:`_loaded_themes`, which is the same for every
+    site using a built-in theme.
+
+    """
+    from attics.models import BUILT_IN_THEMES
+    if (not os.path.dirname(themespec)
+            and not os.path.isdir(os.path.join(search_dir, themespec))):
+        return os.path.join(BUILT_IN_THEMES, themespec)
+    return (themespec, search_dir)
+
+
+def make_bytecode_cache(directory):
+    """
+    Return a ``jinja2.FileSystemBytecodeCache`` storing compiled
+    templates in ``directory``, or ``None`` if it is ``None``.
+
+    Jinja2 names the cache files after each template's path and
+    checks the template's source checksum when loading them.
+
+    """
+    if directory is None:
+        return None
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    import jinja2
+    return jinja2.FileSystemBytecodeCache(directory)
+
 
+def read_pages(config, reader=None, timings=None):
+    """
+    Read the input files described by ``config`` and return a list of
+    :class:`Page` instances in navigation order.
+
+    In streaming mode, the pages' content is not kept.
+
+    """
+    input_dir = config['attics']['input_path']
     logger.info("Reading input files from '%s'", input_dir)
-    pages = MarkdownReader().read_dir(input_dir)
+    if reader is None:
+        from attics.readers import MarkdownReader
+        reader = MarkdownReader(make_cache(config))
+    if timings is None:
+        timings = Timings()
+    jobs = get_int_option(config, 'attics', 'jobs')
+    streaming = get_bool_option(config, 'attics', 'streaming')
+    with timings.phase('read'):
+        pages = reader.read_dir(input_dir, jobs, keep_content=not streaming)
+        if reader.cache is not None:
+            reader.cache.prune()
+    timings.merge_pages(reader.page_timings)
+    reader.page_timings.clear()
+    with timings.phase('sort'):
+        sort_pages(pages)
+    logger.info("Found %d input files", len(pages))
+    return pages
+
+
+def scan_pages(config, reader=None, timings=None):
+    """
+    Like :func:`read_pages`, but only read the metadata header of each
+    input file, returning :class:`Page` instances without content.
+
+    This is enough to know the navigation, and much faster than
+    converting every page, most of which may not need rendering. Each
+    page's content is read with ``reader`` when it is first used.
+
+    """
+    input_dir = config['attics']['input_path']
+    logger.info("Scanning input files in '%s'", input_dir)
+    if reader is None:
+        from attics.readers import MarkdownReader
+        reader = MarkdownReader(make_cache(config))
+    if timings is None:
+        timings = Timings()
+    with timings.phase('read'):
+        pages = reader.scan_dir(input_dir)
+    timings.merge_pages(reader.page_timings)
+    reader.page_timings.clear()
+    with timings.phase('sort'):
+        sort_pages(pages)
+    logger.info("Found %d input files", len(pages))
+    return pages
+
+
+def sort_pages(pages):
+    """Sort ``pages`` in place by index, then by title."""
     pages.sort(key=lambda x: x.title)
     pages.sort(key=lambda x: x.index)
-    logger.info("Found %d input files", len(pages))
 
+
+def format_page_list(pages):
+    """
+    Return a table of the index, output path and title of each of
+    ``pages``, one per line.
+
+    """
+    return u''.join(
+        u'%5d  %-30s  %s\n' % (page.index, unicode(page), page.title)
+        for page in pages
+    )
+
+
+def build(config, theme, pages, previous, reader=None, timings=None):
+    """
+    Render ``pages`` with ``theme`` and copy the theme's files and
+    images into the output directory, skipping whatever is unchanged
+    since the ``previous`` :class:`BuildManifest`.
+
+    Pages read without their content are read again with ``reader``
+    (a new :class:`MarkdownReader` if not given) if they need to be
+    rendered. In streaming mode, each page is read just before it is
+    rendered and its content is dropped again once written, otherwise
+    they are all read at once using ``jobs`` processes.
+
+    Return a tuple of the new, saved manifest and a dict with the
+    number of files ``'written'``, ``'copied'`` and ``'skipped'``.
+
+    """
+    if timings is None:
+        timings = Timings()
+    output_dir = config['attics']['output_path']
+    manifest = BuildManifest()
+    manifest.theme = theme_digest(theme)
+    manifest.config = config_digest(config)
+    manifest.navigation = [[unicode(p), p.title, p.index] for p in pages]
+    stats = {'written': 0, 'copied': 0, 'skipped': 0, 'compressed': 0}
+    if get_bool_option(config, 'attics', 'fingerprint_assets'):
+        with timings.phase('copy'):
+            manifest.asset_names = fingerprint_assets(theme, previous)
+            write_asset_manifest(output_dir, manifest.asset_names, stats)
+    strategy = get_choice_option(
+        config, 'attics', 'copy_strategy', COPY_STRATEGIES,
+    )
+    with timings.phase('images'):
+        variants = make_image_variants(
+            config, theme, manifest, previous, stats, strategy,
+        )
+    affected = affected_pages(theme, config['site'], previous)
+    stale = stale_pages(pages, output_dir, manifest, previous, stats,
+                        affected)
+    input_dir = config['attics']['input_path']
+    missing = [page for page in stale if not page.content_loaded]
+    if reader is None and missing:
+        from attics.readers import MarkdownReader
+        reader = MarkdownReader(make_cache(config))
+    if missing and not get_bool_option(config, 'attics', 'streaming'):
+        jobs = get_int_option(config, 'attics', 'jobs')
+        with timings.phase('read'):
+            reader.read_content(missing, input_dir, jobs)
+        timings.merge_pages(reader.page_timings)
+        reader.page_timings.clear()
+    index = make_search_index(config)
+    prepare_page_content(stale, variants, index, manifest, timings)
+
+    def load_content(page):
+        if page.content_loaded:
+            return False
+        with timings.phase('read'):
+            page.content = reader.read(page.location, input_dir).content
+        timings.merge_pages(reader.page_timings)
+        reader.page_timings.clear()
+        prepare_page_content([page], variants, index, manifest, timings)
+        return True
+
+    minifier = make_minifier(config, reader, stale)
+    render_pages(
+        theme, pages, stale, config['site'], output_dir, stats, load_content,
+        timings, minifier, manifest.dependencies,
+    )
+    record_inputs(theme, config['site'], manifest)
+    write_extra_outputs(
+        config, index, pages, manifest, previous, stats, timings,
+    )
+    with timings.phase('copy'):
+        copy_assets(theme, output_dir, manifest, previous, stats, strategy)
+        mirror_static(config, manifest, previous, stats, strategy)
+    if get_bool_option(config, 'attics', 'compress'):
+        with timings.phase('compress'):
+            compress_outputs(config, theme, pages, manifest, previous, stats)
+    elif previous is not None:
+        delete_stale_outputs([], [
+            path + extension for path in previous.compressed
+            for extension in ('.gz', '.br')
+        ])
+    manifest.save(output_dir)
+    logger.info(
+        "Wrote %d files, copied %d files, skipped %d unchanged files, "
+        "compressed %d files",
+        stats['written'],
+        stats['copied'],
+        stats['skipped'],
+        stats['compressed'],
+    )
+    return manifest, stats
+
+
+def make_minifier(config, reader, stale):
+    """
+    Return the :class:`minify.HTMLMinifier` for the ``stale`` pages if
+    the ``minify_html`` option is on, or ``None``. It uses the pool of
+    the :class:`MarkdownReader` ``reader`` if it has one.
+
+    """
+    if not get_bool_option(config, 'attics', 'minify_html'):
+        return None
+    from attics.minify import HTMLMinifier
+    jobs = get_int_option(config, 'attics', 'jobs')
+    return HTMLMinifier(
+        worker_count(jobs, len(stale)) or 1,
+        reader.pool if reader is not None else None,
+    )
+
+
+def fingerprint_assets(theme, previous):
+    """
+    Replace the files and images of ``theme`` with copies whose
+    output names include a hash of their content, and return a dict
+    of the new names keyed by the plain names.
+
+    Hashes recorded in the ``previous`` :class:`BuildManifest` are
+    reused for files whose size and mtime haven't changed.
+
+    """
+    known = previous.source_digests() if previous is not None else {}
+    names = {}
+    for assets in (theme.files, theme.images):
+        for spec, asset in assets.items():
+            st = os.stat(asset.location)
+            entry = known.get(asset.location)
+            if entry is not None and entry[:2] == (st.st_mtime, st.st_size):
+                digest = entry[2]
+            else:
+                digest = file_digest(asset.location)
+            asset = copy.copy(asset)
+            asset.fingerprint = digest[:FINGERPRINT_LENGTH]
+            assets[spec] = asset
+            names[asset.name + asset.extn] = unicode(asset)
+    return names
+
+
+def write_asset_manifest(output_dir, asset_names, stats):
+    """
+    Write the dict of fingerprinted names ``asset_names`` to the
+    :data:`ASSET_MANIFEST_NAME` file in ``output_dir`` if it changed,
+    updating the ``'written'`` or ``'skipped'`` count in ``stats``.
+
+    """
+    serialized = json.dumps(asset_names, indent=1, sort_keys=True)
+    path = os.path.join(output_dir, ASSET_MANIFEST_NAME)
+    if write_file(path, unicode(serialized), only_if_changed=True):
+        stats['written'] += 1
+    else:
+        stats['skipped'] += 1
+
+
+def compress_outputs(config, theme, pages, manifest, previous, stats):
+    """
+    Write compressed sidecar files for the rendered pages and copied
+    files that need them, recording their hashes in ``manifest`` and
+    updating the ``'compressed'`` count in ``stats``.
+
+    """
+    output_dir = config['attics']['output_path']
+    paths = [os.path.join(output_dir, unicode(page)) for page in pages]
+    for asset in list(theme.files.values()) + list(theme.images.values()):
+        paths.append(os.path.join(output_dir, unicode(asset)))
+    if manifest.asset_names:
+        paths.append(os.path.join(output_dir, ASSET_MANIFEST_NAME))
+    paths.extend(manifest.static)
+    paths.extend(manifest.search)
+    paths.extend(manifest.sitemaps)
+    from attics.compress import Compressor
+    compressor = Compressor(
+        get_int_option(config, 'attics', 'compress_min_size'),
+        get_int_option(config, 'attics', 'gzip_level'),
+        get_int_option(config, 'attics', 'brotli_level'),
+    )
+    manifest.compressed, stats['compressed'] = compressor.compress_all(
+        paths,
+        previous.compressed if previous is not None else {},
+        get_int_option(config, 'attics', 'jobs'),
+    )
+
+
+def make_cache(config):
+    """
+    Return the :class:`ConversionCache` described by ``config``, or
+    ``None`` if caching is disabled.
+
+    Its entries are kept in their own subfolder of the cache folder,
+    since pruning them must not remove what the rest of the build
+    keeps there.
+
+    """
+    if not get_bool_option(config, 'attics', 'cache'):
+        logger.info("Conversion cache disabled")
+        return None
+    max_size = get_int_option(config, 'attics', 'cache_size') * 1024 * 1024
+    location = os.path.join(config['attics']['cache_path'], 'markdown')
+    return ConversionCache(location, max_size)
+
+
+def stale_pages(pages, output_dir, manifest, previous, stats,
+                affected=()):
+    """
+    Return the list of ``pages`` whose source changed since the
+    ``previous`` :class:`BuildManifest` or whose output path is in
+    ``affected``, or all of them if a change affects every page,
+    recording their sources in ``manifest`` and counting the others as
+    ``'skipped'`` in ``stats``.
+
+    The dependencies of the skipped pages are copied to ``manifest``.
+
+    """
+    reason = manifest.full_rebuild_reason(previous)
+    if reason is not None:
+        logger.info("Rendering all pages: %s", reason)
+    elif affected:
+        logger.info(
+            "Rendering %d pages using changed templates or options",
+            len(affected),
+        )
+    stale = []
     for page in pages:
-        rendered = theme.render_template(page, pages, config['site'])
-        write_file(os.path.join(output_dir, unicode(page)), rendered)
-    for file in theme.files.values():
-        copy_file(file.location, os.path.join(output_dir, unicode(file)))
-    for image in theme.images.values():
-        copy_file(image.location, os.path.join(output_dir, unicode(image)))
+        path = unicode(page)
+        dest = os.path.join(output_dir, path)
+        changed = manifest.record_source(page.location, previous)
+        if (reason is None and not changed and path not in affected
+                and path in previous.dependencies and os.path.isfile(dest)):
+            logger.debug("Skipping unchanged page %s", page.location)
+            stats['skipped'] += 1
+            manifest.dependencies[path] = previous.dependencies[path]
+        else:
+            stale.append(page)
+    return stale
 
 
-def compile_less_css(dirpath):
+def render_pages(theme, pages, stale, site, output_dir, stats,
+                 load_content=None, timings=None, minifier=None,
+                 dependencies=None):
     """
-    Attempt to compile files in ``dirpath`` ending with '.less' into
-    '.css' files.
+    Render and write the ``stale`` pages, with the navigation of all
+    ``pages``.
+
+    Pages are only written if their output changed, and the
+    ``'written'`` and ``'skipped'`` counts in ``stats`` are updated.
+
+    If given, ``load_content(page)`` is called before rendering each
+    page and must return True if it loaded the page's content, in
+    which case the page is streamed to its file and the content is
+    dropped again afterwards. Streamed pages are timed as rendering,
+    since rendering and writing them are interleaved.
 
-    The LESS compiler must be on PATH for this work (``lessc.exe``
-    on Windows, ``lessc`` on others).
+    If given, the :class:`minify.HTMLMinifier` ``minifier`` minifies
+    and writes each page instead, whole, streamed or not.
+
+    If given, the :meth:`dependencies.Dependencies.to_json` lists of
+    the inputs each page uses are stored in the dict ``dependencies``,
+    keyed by output path.
 
     """
-    less_input_output_files = []
-    for name in os.listdir(dirpath):
-        if name.lower().endswith('.less') and os.path.isfile(name):
-            base, ext = os.path.splitext(name)
-            less_input_output_files.append(
-                os.path.join(dirpath, '%s.%s' % (base, ext)),
-                os.path.join(dirpath, '%s.css' % base),
+    if timings is None:
+        timings = Timings()
+    fragments = None
+    minified = 0
+    for page in stale:
+        if fragments is None:
+            with timings.phase('render'):
+                fragments = theme.render_fragments(pages, site, timings)
+        streamed = load_content is not None and load_content(page)
+        written, recorded = render_page(
+            theme, page, pages, site, fragments, output_dir, streamed,
+            timings, minifier,
+        )
+        if dependencies is not None:
+            dependencies[unicode(page)] = recorded.to_json()
+        if streamed or page.loader is not None:
+            # It is loaded again if another page uses it
+            page.content = None
+        if written is None:
+            minified += 1
+        elif written:
+            stats['written'] += 1
+        else:
+            stats['skipped'] += 1
+    if minifier is not None:
+        with timings.phase('write'):
+            written = minifier.finish()
+        stats['written'] += written
+        stats['skipped'] += minified - written
+
+
+def render_page(theme, page, pages, site, fragments, output_dir, streamed,
+                timings, minifier=None):
+    """
+    Render ``page`` as :func:`render_pages` does, and return a tuple of
+    whether its file was written, or ``None`` if it was given to the
+    ``minifier``, and the :class:`dependencies.Dependencies` recorded.
+
+    """
+    from attics.dependencies import Dependencies
+    dest = os.path.join(output_dir, unicode(page))
+    template = theme.template_name
+    recorded = Dependencies()
+    if streamed and minifier is None:
+        with timings.phase('render', page.location, template):
+            chunks = theme.generate_template(
+                page, pages, site, fragments, recorded,
             )
-    if not less_input_output_files:
+            written = write_chunks(dest, chunks, only_if_changed=True)
+            return written, recorded
+    with timings.phase('render', page.location, template):
+        rendered = theme.render_template(
+            page, pages, site, fragments, recorded,
+        )
+    with timings.phase('write', page.location):
+        if minifier is None:
+            written = write_file(dest, rendered, only_if_changed=True)
+            return written, recorded
+        minifier.write(dest, rendered)
+    return None, recorded
+
+
+def affected_pages(theme, site, previous):
+    """
+    Return the set of the output paths of the pages rendered by the
+    ``previous`` :class:`BuildManifest` with a template, ``site``
+    option, file or image of ``theme`` that changed since.
+
+    """
+    if previous is None:
+        return set()
+    from attics.dependencies import changed_inputs
+    return previous.affected_pages(
+        changed_inputs(previous.inputs, theme, site),
+    )
+
+
+def record_inputs(theme, site, manifest):
+    """
+    Record the current state of every input the pages in ``manifest``
+    depend on, for the next build to find the pages affected by a
+    change.
+
+    """
+    from attics.dependencies import Dependencies, input_state
+    names = Dependencies.merge_all(manifest.dependencies.values())
+    manifest.inputs = input_state(theme, site, names.to_json())
+
+
+def copy_assets(theme, output_dir, manifest, previous, stats,
+                strategy='copy'):
+    """
+    Copy the theme files and images whose source or copy changed since
+    the ``previous`` :class:`BuildManifest` with the copy ``strategy``
+    (see :func:`utils.copy_file`), recording them in ``manifest``.
+
+    Files are only copied if their content changed, and the
+    ``'copied'`` and ``'skipped'`` counts in ``stats`` are updated.
+    Unchanged files are found by their mtime, size and inode alone.
+
+    """
+    assets = list(theme.files.values()) + list(theme.images.values())
+    for asset in assets:
+        dest = os.path.join(output_dir, unicode(asset))
+        if copy_asset(asset.location, dest, manifest, previous, strategy):
+            stats['copied'] += 1
+        else:
+            stats['skipped'] += 1
+
+
+def copy_asset(src, dest, manifest, previous, strategy='copy'):
+    """
+    Copy ``src`` to ``dest`` with the copy ``strategy`` unless neither
+    changed since the ``previous`` :class:`BuildManifest`, record it
+    in ``manifest``, and return True if it was copied.
+
+    """
+    changed = manifest.record_asset(src, dest, previous)
+    if not changed and manifest.output_unchanged(dest, strategy, previous):
+        logger.debug("Skipping unchanged file %s", src)
+        return False
+    copied = copy_file(src, dest, True, strategy)
+    manifest.record_output(dest, strategy)
+    return copied
+
+
+def mirror_static(config, manifest, previous, stats, strategy='copy'):
+    """
+    Copy the files in the ``static_path`` folder and its subfolders
+    to the same paths in the output folder, if it is set, recording
+    them in ``manifest``.
+
+    The folder is listed in a single pass, and files are copied by
+    ``jobs`` threads with :func:`copy_asset`, updating the ``'copied'``
+    and ``'skipped'`` counts in ``stats``. If ``static_delete`` is
+    set, the copies of files removed since the ``previous`` build are
+    deleted.
+
+    """
+    static_dir = config['attics']['static_path']
+    if not static_dir:
         return
-    if 'win32' in sys.platform:
-        lessc = 'lessc.exe'
+    output_dir = config['attics']['output_path']
+    if os.path.isdir(static_dir):
+        patterns = DEFAULT_IGNORE_PATTERNS + read_ignore_file(static_dir)
+        tasks = [
+            (entry.path, os.path.join(output_dir, *relpath.split('/')))
+            for relpath, entry in walk_files(static_dir, patterns)
+        ]
     else:
-        lessc = 'lessc'
-    logger.info(
-        "Attempting to compile %d LESS files in %s" % (
-            len(less_input_output_files),
-            dirpath,
-        )
+        logger.warning("Static folder '%s' does not exist", static_dir)
+        tasks = []
+    manifest.static = sorted(
+        manifest.static + [dest for src, dest in tasks]
     )
+    logger.info("Mirroring %d files from '%s'", len(tasks), static_dir)
+
+    def copy_task(task):
+        return copy_asset(task[0], task[1], manifest, previous, strategy)
+
+    jobs = worker_count(get_int_option(config, 'attics', 'jobs'), len(tasks))
+    if jobs <= 1:
+        results = [copy_task(task) for task in tasks]
+    else:
+        import multiprocessing.pool
+        # Copying is mostly waiting for the disk, with the GIL released
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            results = pool.map(copy_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    copied = sum(1 for result in results if result)
+    stats['copied'] += copied
+    stats['skipped'] += len(results) - copied
+    delete = get_bool_option(config, 'attics', 'static_delete')
+    if delete and previous is not None:
+        delete_stale_outputs(manifest.static, previous.static)
+
+
+def make_image_variants(config, theme, manifest, previous, stats,
+                        strategy='copy'):
+    """
+    Make resized variants of the images in the ``static_path`` folder
+    at the widths in the ``[variants]`` section of ``theme``, copy
+    them into the output folder next to their images, and return the
+    :class:`images.ImageVariants` to add them to pages with, or
+    ``None`` if there are no widths, static folder or Pillow.
+
+    Variants are made with ``jobs`` processes and kept in the
+    ``images`` folder of the cache folder, so each is only made once.
+    Image hashes recorded in the ``previous`` :class:`BuildManifest`
+    are reused for images whose size and mtime haven't changed.
+
+    """
+    static_dir = config['attics']['static_path']
+    if not theme.variants.get('widths') or not static_dir:
+        return None
+    from attics.images import (
+        ImageVariants, PILImage, VARIANT_DEFAULTS, parse_widths,
+    )
+    options = dict(VARIANT_DEFAULTS)
+    options.update(theme.variants)
+    if PILImage is None:
+        logger.warning("Install Pillow to make image variants")
+        return None
     try:
-        subprocess.call(lessc)
-    except OSError as e:
-        logger.warning(
-            "Could not find LESS compiler, is it installed and on PATH?"
-        )
-        return
-    for src, dst in less_input_output_files:
-        proc = subprocess.Popen(
-            [lessc, src, dst],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+        widths = parse_widths(options['widths'])
+    except ValueError:
+        raise ConfigError(
+            'Option widths in section [variants] must be a list of '
+            'positive integers, not %r' % options['widths']
         )
-        out, err = proc.communicate()
-        if proc.returncode != 0:
-            logger.warning("Failed to compile %s, output:" % src)
-            logger.warning(out)
-            logger.warning("Error output:")
-            logger.warning(err)
+    quality = get_int_option({'variants': options}, 'variants', 'quality')
+    output_dir = config['attics']['output_path']
+    cache_dir = os.path.join(config['attics']['cache_path'], 'images')
+    variants = ImageVariants(widths, cache_dir, quality, options['sizes'])
+    images = find_static_images(static_dir, previous)
+    jobs = get_int_option(config, 'attics', 'jobs')
+    for cached, relpath in variants.make(images, jobs):
+        dest = os.path.join(output_dir, *relpath.split('/'))
+        manifest.static.append(dest)
+        if copy_asset(cached, dest, manifest, previous, strategy):
+            stats['copied'] += 1
+        else:
+            stats['skipped'] += 1
+    manifest.image_variants = dict(
+        (relpath, [width for width, path in srcset[:-1]])
+        for relpath, srcset in variants.srcsets.items()
+    )
+    return variants
+
+
+def find_static_images(static_dir, previous):
+    """
+    Return a list of ``(relpath, path, digest)`` tuples of the images
+    in the ``static_dir`` folder that can have variants, with their
+    path relative to it using forward slashes, and their hash.
+
+    Hashes recorded in the ``previous`` :class:`BuildManifest` are
+    reused for images whose size and mtime haven't changed.
+
+    """
+    from attics.images import IMAGE_EXTENSIONS
+    if not os.path.isdir(static_dir):
+        return []
+    known = previous.source_digests() if previous is not None else {}
+    patterns = DEFAULT_IGNORE_PATTERNS + read_ignore_file(static_dir)
+    images = []
+    for relpath, entry in walk_files(static_dir, patterns):
+        if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        st = entry.stat()
+        old = known.get(entry.path)
+        if old is not None and old[:2] == (st.st_mtime, st.st_size):
+            digest = old[2]
         else:
-            logger.info("Compiled %s to %s" % (src, dst))
+            digest = file_digest(entry.path)
+        images.append((relpath, entry.path, digest))
+    return images
 
 
-def make_configuration(config_filename, input_path=None, output_path=None):
+def prepare_page_content(pages, variants, index, manifest, timings):
+    """
+    Add the image variants of the :class:`images.ImageVariants`
+    ``variants`` to the loaded ones of ``pages``, then add them to the
+    :class:`search.SearchIndex` ``index`` with the source hashes
+    recorded in ``manifest``. Either can be ``None``.
+
+    """
+    for page in pages:
+        if not page.content_loaded:
+            continue
+        if variants is not None:
+            with timings.phase('images'):
+                add_srcsets(page, variants)
+        if index is not None:
+            with timings.phase('index'):
+                index.add(page, manifest.sources[page.location]['hash'])
+
+
+def add_srcsets(page, variants):
+    """
+    Add the image variants of the :class:`images.ImageVariants`
+    ``variants`` to the ``<img>`` tags in the content of ``page``.
+
+    """
+    page.content = variants.rewrite(page.content, page.directory)
+
+
+def make_search_index(config):
+    """
+    Return the :class:`search.SearchIndex` described by ``config``, or
+    ``None`` if the ``search_index`` option is off. Its terms are only
+    kept between builds with the cache enabled.
+
+    """
+    if not get_bool_option(config, 'attics', 'search_index'):
+        return None
+    if not get_bool_option(config, 'attics', 'cache'):
+        return SearchIndex()
+    return SearchIndex(
+        os.path.join(config['attics']['cache_path'], 'search.json'),
+    )
+
+
+def write_extra_outputs(config, index, pages, manifest, previous, stats,
+                        timings):
+    """
+    Write the outputs listing every page, once they are rendered: the
+    :class:`search.SearchIndex` ``index`` unless it is ``None``, and
+    the sitemap if the ``sitemap`` option is on.
+
+    """
+    output_dir = config['attics']['output_path']
+    if index is not None:
+        with timings.phase('index'):
+            write_search_index(index, pages, output_dir, manifest, previous,
+                               stats)
+    if get_bool_option(config, 'attics', 'sitemap'):
+        with timings.phase('write'):
+            write_sitemap(config, pages, manifest, previous, stats)
+
+
+def write_search_index(index, pages, output_dir, manifest, previous, stats):
+    """
+    Write the :class:`search.SearchIndex` ``index`` of ``pages`` to the
+    output folder, recording its files in ``manifest`` and updating
+    the ``'written'`` and ``'skipped'`` counts in ``stats``, and delete
+    the shards the ``previous`` build wrote that are no longer used.
+
+    """
+    digests = dict(
+        (location, entry['hash'])
+        for location, entry in manifest.sources.items()
+    )
+    manifest.search, written = index.write(output_dir, pages, digests)
+    stats['written'] += written
+    stats['skipped'] += len(manifest.search) - written
+    if previous is not None:
+        delete_stale_outputs(manifest.search, previous.search)
+
+
+def write_sitemap(config, pages, manifest, previous, stats):
+    """
+    Write a sitemap of ``pages`` at the ``base_url`` option to the
+    output folder, with the modification time of each page's source
+    as recorded in ``manifest``, recording its files in ``manifest``
+    and updating the ``'written'`` and ``'skipped'`` counts in
+    ``stats``, and delete the shards the ``previous`` build wrote that
+    are no longer used.
+
+    """
+    base_url = config['attics']['base_url']
+    if not base_url:
+        raise ConfigError(
+            'Option base_url in section [attics] must be set to write a '
+            'sitemap'
+        )
+    from attics.sitemap import sitemap_entries, write_sitemaps
+    mtimes = dict(
+        (location, entry['mtime'])
+        for location, entry in manifest.sources.items()
+    )
+    entries = sitemap_entries(pages, base_url, mtimes)
+    manifest.sitemaps, written = write_sitemaps(
+        config['attics']['output_path'], base_url, entries,
+    )
+    stats['written'] += written
+    stats['skipped'] += len(manifest.sitemaps) - written
+    if previous is not None:
+        delete_stale_outputs(manifest.sitemaps, previous.sitemaps)
+
+
+def delete_stale_outputs(paths, previous_paths):
+    """
+    Delete the output files in ``previous_paths`` that aren't in
+    ``paths`` anymore, along with their compressed copies.
+
+    """
+    for dest in sorted(set(previous_paths) - set(paths)):
+        for path in (dest, dest + '.gz', dest + '.br'):
+            if os.path.lexists(path):
+                logger.info("Deleting stale %s", path)
+                os.remove(path)
+
+
+def compile_less_css(config):
+    """
+    Compile the '.less' files in the folders of the files listed in
+    the ``[files]`` section of ``config`` into '.css' files next to
+    them, if the ``compile_less_css`` option is set, and return the
+    number of files compiled.
+
+    The compiler is the ``lessc`` option's command line, and runs
+    ``jobs`` times at once. With the cache enabled, compiled CSS is
+    kept in the cache folder, so stylesheets whose source and imports
+    are unchanged are not compiled again.
+
+    """
+    if not get_bool_option(config, 'attics', 'compile_less_css'):
+        return 0
+    cache_dir = None
+    if get_bool_option(config, 'attics', 'cache'):
+        cache_dir = os.path.join(config['attics']['cache_path'], 'less')
+    from attics.less import LessCompiler, find_less_files
+    compiler = LessCompiler(config['attics']['lessc'], cache_dir)
+    input_dir = config['attics']['input_path']
+    dirpaths = set(
+        os.path.dirname(os.path.join(input_dir, filepath))
+        for filepath in config.get('files', {}).values()
+    )
+    paths = []
+    for dirpath in sorted(dirpaths):
+        paths.extend(find_less_files(dirpath))
+    if not paths:
+        return 0
+    logger.info("Compiling %d LESS files", len(paths))
+    jobs = get_int_option(config, 'attics', 'jobs')
+    return compiler.compile_all(paths, jobs)
+
+
+def make_configuration(config_filename, input_path=None, output_path=None,
+                       jobs=None, cache=None):
     default_config = create_default_settings()
     theme_search_dir = os.path.dirname(config_filename)
     default_config['attics']['theme_search'] = theme_search_dir
@@ -126,6 +1085,10 @@ def make_configuration(config_filename, input_path=None, output_path=None):
         args_config['attics']['input_path'] = input_path
     if output_path is not None:
         args_config['attics']['output_path'] = output_path
+    if jobs is not None:
+        args_config['attics']['jobs'] = str(jobs)
+    if cache is not None:
+        args_config['attics']['cache'] = 'yes' if cache else 'no'
     return merge_dict_of_dicts(default_config, user_config, args_config)
 
 
@@ -145,17 +1108,47 @@ def setup_logger(verbosity):
 
 
 def parse_args(args=None):
-    description = "Create simple static sites from Markdown files.",
+    description = "Create simple static sites from Markdown files."
     epilog = textwrap.dedent(
         """Relative paths are taken from the configuration file's
         parent directory.
     """)
     parser = argparse.ArgumentParser(
-        usage="%(prog)s [OPTIONS]",
+        usage=(
+            "%(prog)s [OPTIONS] [build|serve]\n"
+            "       %(prog)s [OPTIONS] build-many SITE_CONFIG..."
+        ),
         description=description,
         epilog=epilog,
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=['build', 'serve', 'build-many'],
+        default='build',
+        help=textwrap.dedent(
+            """Build the site once, or build it, serve the output
+            directory with live reloading and rebuild on changes,
+            or build each of the sites given after it in one
+            process.
+        """),
+    )
+    parser.add_argument(
+        'sites',
+        nargs='*',
+        metavar='SITE_CONFIG',
+        help='The configuration files of the sites to build-many.',
+    )
+    parser.add_argument(
+        '--sites-file',
+        dest='sites_file',
+        metavar='FILE',
+        help=textwrap.dedent(
+            """A file listing the configuration files of the sites
+            to build-many, one per line, relative to its folder.
+        """),
+    )
     parser.add_argument(
         '-v',
         action='count',
@@ -188,6 +1181,80 @@ def parse_args(args=None):
             configuration file's folder.
         """),
     )
-    if args is None:
-        return parser.parse_args()
-    return parser.parse_args(args)
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        metavar='N',
+        help=textwrap.dedent(
+            """The number of processes used to read the source
+            files. Use 0 for one per CPU. build-many shares one
+            pool of this many processes, one per CPU by default.
+        """),
+    )
+    parser.add_argument(
+        '--no-cache',
+        dest='cache',
+        action='store_false',
+        default=None,
+        help='Convert every source file, ignoring the conversion cache.',
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        metavar='FILE',
+        help=textwrap.dedent(
+            """Profile the build and write the statistics to FILE,
+            for use with the pstats module. Pages read by worker
+            processes are not included.
+        """),
+    )
+    parser.add_argument(
+        '--stats',
+        dest='stats',
+        choices=['text', 'json'],
+        help='Print the time taken by each phase, page and template.',
+    )
+    parser.add_argument(
+        '--stats-limit',
+        dest='stats_limit',
+        type=int,
+        default=10,
+        metavar='N',
+        help='The number of slowest pages and templates to print.',
+    )
+    parser.add_argument(
+        '-l', '--list-pages',
+        dest='list_pages',
+        action='store_true',
+        help=textwrap.dedent(
+            """List the index, output path and title of each page
+            in navigation order, without building the site.
+        """),
+    )
+    parser.add_argument(
+        '-w', '--watch',
+        dest='watch',
+        action='store_true',
+        help='Keep running and rebuild whenever a source file changes.',
+    )
+    parser.add_argument(
+        '--host',
+        dest='host',
+        default='localhost',
+        help='The address the serve command listens on.',
+    )
+    parser.add_argument(
+        '-p', '--port',
+        dest='port',
+        type=int,
+        default=8000,
+        help='The port the serve command listens on.',
+    )
+    parsed = parser.parse_args(args)
+    if parsed.command == 'build-many':
+        if not parsed.sites and not parsed.sites_file:
+            parser.error('build-many needs configuration files to build')
+    elif parsed.sites or parsed.sites_file:
+        parser.error('only build-many takes configuration files')
+    return parsed
@@ -1,22 +1,421 @@
+import os
 import io
+import re
+import sys
+import stat
+import errno
 import shutil
+import fnmatch
+import hashlib
 import logging
+import tempfile
+import posixpath
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+scandir = False
+"""
+``os.scandir``, or that of the ``scandir`` package, which loads ctypes
+and is only imported when first needed, ``None`` if neither exists,
+or ``False`` until first needed.
+"""
 
 
 logger = logging.getLogger(__name__)
 
+# Temporary files are created private, so written files are given the
+# permissions a plain open() would have used
+_umask = os.umask(0)
+os.umask(_umask)
+
 
 def open_file(filename, mode='r'):
     logger.debug("Opening file %s" % filename)
     return io.open(filename, mode, encoding="utf-8")
 
 
-def write_file(filename, content):
+def write_file(filename, content, only_if_changed=False):
+    """
+    Write the unicode string ``content`` to ``filename`` as UTF-8 and
+    return True, or return False without touching the file if
+    ``only_if_changed`` is set and it already has that content.
+
+    The content is written to a temporary file which then replaces
+    ``filename``, so an interrupted write never leaves a partial file.
+    Missing parent folders are created.
+
+    """
+    return write_bytes(filename, content.encode('utf-8'), only_if_changed)
+
+
+def write_bytes(filename, data, only_if_changed=False):
+    """
+    Like :func:`write_file`, but write the byte string ``data`` as is.
+
+    """
+    if only_if_changed and _has_content(filename, data):
+        logger.debug("Skipping unchanged %s", filename)
+        return False
     logger.info("Writing to %s", filename)
-    with open_file(filename, 'w') as fp:
-        fp.write(content)
+    make_parent_dir(filename)
+    fd, tmp_path = _make_temp_file(filename)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        replace_file(tmp_path, filename)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return True
+
+
+def write_chunks(filename, chunks, only_if_changed=False):
+    """
+    Like :func:`write_file`, but write the iterable of unicode strings
+    ``chunks`` as they are produced, so the whole content never needs
+    to be in memory.
 
+    With ``only_if_changed``, the chunks are written to the temporary
+    file and hashed, which is discarded if ``filename`` already has
+    the same content.
 
-def copy_file(src, dest):
+    """
+    make_parent_dir(filename)
+    fd, tmp_path = _make_temp_file(filename)
+    try:
+        digest = hashlib.sha1()
+        size = 0
+        with os.fdopen(fd, 'wb') as fp:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                digest.update(data)
+                size += len(data)
+                fp.write(data)
+        if only_if_changed and _has_digest(filename, size, digest):
+            logger.debug("Skipping unchanged %s", filename)
+            os.remove(tmp_path)
+            return False
+        logger.info("Writing to %s", filename)
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        replace_file(tmp_path, filename)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return True
+
+
+COPY_STRATEGIES = ['copy', 'hardlink', 'reflink', 'symlink']
+"""The ways :func:`copy_file` can copy a file"""
+
+FICLONE = 0x40049409
+"""The Linux ioctl request making a file share another file's data"""
+
+
+def copy_file(src, dest, only_if_changed=False, strategy='copy'):
+    """
+    Copy ``src`` to ``dest`` and return True, or return False without
+    touching ``dest`` if ``only_if_changed`` is set and it already is
+    a copy of ``src`` made with ``strategy``.
+
+    ``strategy`` is one of :data:`COPY_STRATEGIES`: ``'copy'`` copies
+    the content, ``'hardlink'`` makes ``dest`` a hard link to ``src``,
+    ``'reflink'`` makes a copy sharing the data of ``src`` until one
+    of them changes, on filesystems that support it (like Btrfs and
+    XFS), and ``'symlink'`` makes ``dest`` a symbolic link to the
+    absolute path of ``src``. If that isn't possible, such as for a
+    hard link to another filesystem, the content is copied.
+
+    Like :func:`write_file`, the copy is made through a temporary file.
+
+    """
+    if only_if_changed and _has_copy(src, dest, strategy):
+        logger.debug("Skipping unchanged %s", dest)
+        return False
     logger.info("Copying %s to %s", src, dest)
-    shutil.copy(src, dest)
+    make_parent_dir(dest)
+    fd, tmp_path = _make_temp_file(dest)
+    os.close(fd)
+    try:
+        _copy_to_temp(src, tmp_path, strategy)
+        replace_file(tmp_path, dest)
+    except Exception:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def _copy_to_temp(src, tmp_path, strategy):
+    """
+    Replace the empty temporary file ``tmp_path`` with a copy of
+    ``src`` made with ``strategy``, or with a plain copy if that
+    fails.
+
+    """
+    try:
+        if strategy == 'hardlink':
+            os.remove(tmp_path)
+            os.link(src, tmp_path)
+            return
+        if strategy == 'symlink':
+            os.remove(tmp_path)
+            os.symlink(os.path.abspath(src), tmp_path)
+            return
+        if strategy == 'reflink':
+            _reflink(src, tmp_path)
+            return
+    except (IOError, OSError, AttributeError) as e:
+        # AttributeError: os.link and os.symlink are missing on Windows
+        logger.debug("Can't %s %s, copying it instead: %s", strategy, src, e)
+    shutil.copy(src, tmp_path)
+
+
+def _reflink(src, dest):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported')
+    with io.open(src, 'rb') as src_fp:
+        with io.open(dest, 'wb') as dest_fp:
+            fcntl.ioctl(dest_fp.fileno(), FICLONE, src_fp.fileno())
+    shutil.copymode(src, dest)
+
+
+def _has_copy(src, dest, strategy):
+    """
+    Return True if ``dest`` is a copy of ``src`` made with
+    ``strategy``, or a plain copy of it if that isn't a link.
+
+    """
+    if strategy == 'symlink':
+        return (
+            os.path.islink(dest)
+            and os.readlink(dest) == os.path.abspath(src)
+        )
+    if os.path.islink(dest):
+        return False
+    if _same_file(src, dest):
+        return strategy == 'hardlink'
+    return same_content(src, dest)
+
+
+def _same_file(first, second):
+    try:
+        return os.path.samefile(first, second)
+    except (OSError, AttributeError):
+        # AttributeError: os.path.samefile is missing on Windows
+        return False
+
+
+def worker_count(jobs, tasks=None):
+    """
+    Return the number of workers to use for the value of the ``jobs``
+    option: one per CPU if it is zero or less, and no more than the
+    number of ``tasks`` if given.
+
+    """
+    if jobs <= 0:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    if tasks is not None:
+        jobs = min(jobs, tasks)
+    return jobs
+
+
+def make_parent_dir(filename):
+    """
+    Create the folder containing ``filename`` if it doesn't exist.
+
+    Safe to call from several threads or processes at once, when
+    another one may create the folder first.
+
+    """
+    dirname = os.path.dirname(filename)
+    if not dirname:
+        return
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(dirname):
+            raise
+
+
+def replace_file(src, dest):
+    """
+    Rename ``src`` to ``dest``, replacing ``dest`` if it exists.
+
+    Atomic on POSIX. Windows can't rename over an existing file, so
+    there ``dest`` is removed first.
+
+    """
+    if sys.platform == 'win32' and os.path.exists(dest):
+        os.remove(dest)
+    os.rename(src, dest)
+
+
+def same_content(first, second):
+    """
+    Return True if the files ``first`` and ``second`` both exist and
+    have the same size and content.
+
+    """
+    try:
+        if os.path.getsize(first) != os.path.getsize(second):
+            return False
+    except OSError:
+        return False
+    return file_digest(first) == file_digest(second)
+
+
+def _has_content(filename, data):
+    return _has_digest(filename, len(data), hashlib.sha1(data))
+
+
+def _has_digest(filename, size, digest):
+    try:
+        if os.path.getsize(filename) != size:
+            return False
+    except OSError:
+        return False
+    return file_digest(filename) == digest.hexdigest()
+
+
+def _make_temp_file(filename):
+    """
+    Return an ``(fd, path)`` tuple for a new temporary file in the
+    same directory as ``filename``, so it can be renamed over it.
+
+    """
+    dirname, basename = os.path.split(filename)
+    return tempfile.mkstemp(dir=dirname or '.', prefix='.%s.' % basename)
+
+
+def file_digest(filename):
+    """
+    Return the hex SHA-1 digest of the contents of ``filename``.
+
+    """
+    digest = hashlib.sha1()
+    with io.open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+DEFAULT_IGNORE_PATTERNS = ['.*', '*~', '*.swp', '*.swo', '#*#']
+"""Patterns of hidden, backup and editor swap files to always skip"""
+
+IGNORE_FILE = '.atticsignore'
+
+
+def read_ignore_file(dirpath):
+    """
+    Return the list of patterns in the :data:`IGNORE_FILE` in
+    ``dirpath``, or an empty list if there isn't one.
+
+    The file contains one shell-style pattern per line. Blank lines
+    and lines starting with ``#`` are skipped.
+
+    """
+    path = os.path.join(dirpath, IGNORE_FILE)
+    if not os.path.isfile(path):
+        return []
+    with open_file(path) as fp:
+        lines = [line.strip() for line in fp]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def walk_files(top, ignore_patterns=()):
+    """
+    Yield a ``(relpath, entry)`` tuple for every file under ``top``,
+    where ``relpath`` is the path relative to ``top`` with forward
+    slashes and ``entry`` has the ``name`` and ``path`` attributes
+    and ``stat()`` method of an ``os.scandir`` entry.
+
+    Files and folders whose name or relative path matches one of
+    ``ignore_patterns`` are skipped. Each entry is listed by a single
+    ``scandir`` pass, so no extra ``stat`` calls are needed to tell
+    files and folders apart where the platform reports entry types.
+
+    """
+    ignored = _ignore_matcher(ignore_patterns)
+    stack = ['']
+    while stack:
+        reldir = stack.pop()
+        for entry in _scan(os.path.join(top, reldir)):
+            relpath = posixpath.join(reldir, entry.name)
+            if ignored(os.path.normcase(entry.name)) or ignored(
+                    os.path.normcase(relpath)):
+                continue
+            if entry.is_dir():
+                stack.append(relpath)
+            elif entry.is_file():
+                yield relpath, entry
+
+
+def _ignore_matcher(patterns):
+    """
+    Return a function telling if a name matches one of the shell-style
+    ``patterns`` like ``fnmatch.fnmatch`` would, testing them all with
+    a single regular expression.
+
+    """
+    if not patterns:
+        return lambda name: False
+    regex = re.compile('|'.join(
+        '(?:%s)' % fnmatch.translate(os.path.normcase(pattern))
+        for pattern in patterns
+    ))
+    return lambda name: regex.match(name) is not None
+
+
+def _scan(dirpath):
+    global scandir
+    if scandir is False:
+        scandir = _import_scandir()
+    if scandir is not None:
+        return scandir(dirpath)
+    return [_ListdirEntry(dirpath, name) for name in os.listdir(dirpath)]
+
+
+def _import_scandir():
+    try:
+        from os import scandir
+    except ImportError:
+        try:
+            from scandir import scandir
+        except ImportError:
+            scandir = None
+    return scandir
+
+
+class _ListdirEntry(object):
+    """
+    A stand-in for ``os.scandir`` entries where neither it nor the
+    ``scandir`` package is available, calling ``stat`` once.
+
+    """
+
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_dir(self):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def is_file(self):
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
@@ -0,0 +1,224 @@
+import os
+import time
+import logging
+import threading
+
+from attics.readers import MarkdownReader
+from attics.tools import (
+    load_theme, read_pages, sort_pages, build, make_cache, compile_less_css,
+)
+from attics.manifest import BuildManifest
+from attics.utils import (
+    walk_files, read_ignore_file, DEFAULT_IGNORE_PATTERNS, IGNORE_FILE,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot(paths):
+    """
+    Return a dict of ``(mtime, size)`` tuples keyed by the normalized
+    path of every file in or under ``paths``.
+
+    Missing paths are left out, and so are the files in folders that
+    the reader skips: hidden files, editor backup and swap files, and
+    those matching the folder's ``.atticsignore`` file, which is
+    included itself.
+
+    """
+    result = {}
+    for path in paths:
+        if os.path.isdir(path):
+            patterns = DEFAULT_IGNORE_PATTERNS + read_ignore_file(path)
+            for relpath, entry in walk_files(path, patterns):
+                st = entry.stat()
+                result[os.path.normpath(entry.path)] = (
+                    st.st_mtime, st.st_size,
+                )
+            _stat_into(result, os.path.join(path, IGNORE_FILE))
+        else:
+            _stat_into(result, path)
+    return result
+
+
+def _stat_into(result, path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    result[os.path.normpath(path)] = (st.st_mtime, st.st_size)
+
+
+def _in_folder(path, folder):
+    relpath = os.path.relpath(path, folder)
+    return relpath != os.pardir and not relpath.startswith(os.pardir + os.sep)
+
+
+def changed_paths(old, new):
+    """
+    Return the set of paths added, removed or modified between the
+    :func:`snapshot` results ``old`` and ``new``.
+
+    """
+    changed = set(old) ^ set(new)
+    changed.update(p for p in new if p in old and old[p] != new[p])
+    return changed
+
+
+class SiteWatcher(object):
+    """
+    Keeps a site's configuration, :class:`models.Theme` and
+    :class:`models.Page` instances in memory, and rebuilds only what
+    changed when the watched files change.
+
+    """
+
+    config_filename = None
+    """The path to the configuration file"""
+
+    build_count = 0
+    """The number of successful builds, incremented after each one"""
+
+    config = None
+    theme = None
+
+    def __init__(self, config_filename, make_config):
+        """
+        :param config_filename: the path to the configuration file
+        :param make_config:     a callable returning the configuration
+                                dict, called again whenever the
+                                configuration file changes
+
+        """
+        self.config_filename = config_filename
+        self._make_config = make_config
+        self._pages = {}
+        self._reader = None
+        self._manifest = None
+        self._snapshot = {}
+        self.build_changed = threading.Condition()
+
+    def watched_paths(self):
+        """Return the list of files and folders to watch for changes."""
+        paths = [self.config_filename]
+        if self.config is not None:
+            paths.append(self.config['attics']['input_path'])
+            if self.config['attics']['static_path']:
+                paths.append(self.config['attics']['static_path'])
+        if self.theme is not None:
+            paths.append(self.theme.location)
+            for asset in self._assets():
+                paths.append(asset.location)
+        return paths
+
+    def start(self):
+        """Load everything from scratch and build the whole site."""
+        self._load_config()
+        self._snapshot = snapshot(self.watched_paths())
+        self._build()
+
+    def poll(self):
+        """
+        Rebuild the site if any watched file changed since the last
+        call, and return True if it did.
+
+        """
+        new = snapshot(self.watched_paths())
+        changed = changed_paths(self._snapshot, new)
+        if not changed:
+            return False
+        self._snapshot = new
+        logger.info("Detected %d changed files", len(changed))
+        started = time.time()
+        try:
+            self.update(changed)
+        except Exception:
+            logger.exception("Rebuild failed, waiting for further changes")
+            return False
+        logger.info("Rebuilt in %.0f ms", (time.time() - started) * 1000)
+        return True
+
+    def update(self, changed):
+        """
+        Reload whatever is affected by the set of normalized paths
+        ``changed`` and rebuild.
+
+        """
+        if os.path.normpath(self.config_filename) in changed:
+            logger.info("Configuration changed, reloading everything")
+            self._load_config()
+            self._snapshot = snapshot(self.watched_paths())
+        else:
+            # Compiling writes into the watched folders, so only do it
+            # when a stylesheet or one of its imports changed
+            if any(path.lower().endswith('.less') for path in changed):
+                compile_less_css(self.config)
+            theme_dir = os.path.normpath(self.theme.location) + os.sep
+            if any(path.startswith(theme_dir) for path in changed):
+                logger.info("Theme changed, reloading theme")
+                self.theme = load_theme(self.config)
+            self._update_pages(changed)
+        self._build()
+
+    def watch(self, interval=0.1):
+        """Poll for changes every ``interval`` seconds, forever."""
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+    def _load_config(self):
+        self.config = self._make_config()
+        compile_less_css(self.config)
+        self.theme = load_theme(self.config)
+        self._reader = MarkdownReader(make_cache(self.config))
+        pages = read_pages(self.config, self._reader)
+        self._pages = dict(
+            (os.path.normpath(page.location), page) for page in pages
+        )
+        self._manifest = BuildManifest.load(
+            self.config['attics']['output_path']
+        )
+
+    def _update_pages(self, changed):
+        """
+        Read the pages among the ``changed`` paths again and forget the
+        removed ones. The input folder is only scanned again if its
+        ignore file changed, since the snapshot already skips ignored
+        files.
+
+        """
+        input_dir = self.config['attics']['input_path']
+        if os.path.normpath(os.path.join(input_dir, IGNORE_FILE)) in changed:
+            current = set(
+                os.path.normpath(path)
+                for path in self._reader.find_files(input_dir)
+            )
+            for path in set(self._pages) - current:
+                logger.info("Removed '%s'", path)
+                del self._pages[path]
+            changed = changed | (current - set(self._pages))
+        extensions = tuple(
+            '.%s' % extension for extension in self._reader.file_extensions
+        )
+        for path in changed:
+            if not (path.endswith(extensions) and _in_folder(path, input_dir)):
+                continue
+            if os.path.isfile(path):
+                self._pages[path] = self._reader.read(path, input_dir)
+            elif self._pages.pop(path, None) is not None:
+                logger.info("Removed '%s'", path)
+
+    def _build(self):
+        pages = list(self._pages.values())
+        sort_pages(pages)
+        self._manifest, stats = build(
+            self.config, self.theme, pages, self._manifest, self._reader,
+        )
+        with self.build_changed:
+            self.build_count += 1
+            self.build_changed.notify_all()
+
+    def _assets(self):
+        theme = self.theme
+        return list(theme.files.values()) + list(theme.images.values())